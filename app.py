@@ -1,10 +1,81 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import altair as alt
 from datetime import timedelta, datetime
 from io import BytesIO
 import base64
 import tempfile
 import os
+import json
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from remote_source import DEFAULT_MIRROR_DIR, GITHUB_HOSTS, LogMirror, create_session, list_http_files, list_github_files, sync_files
+from query_api import DatasetRegistry, start_query_server
+
+# قواعد تصنيف الأحداث الافتراضية (تُطبق بالترتيب، وأول قاعدة مطابقة هي المعتمدة)
+# أنواع المطابقة: exact (تطابق تام) - prefix (بادئة) - range (نطاق أكواد) - regex (تعبير نمطي)
+DEFAULT_EVENT_RULES = [
+    {"category": "run", "match": "exact", "value": "Automatic mode"},
+    {"category": "stop", "match": "exact", "value": "Manual mode"},
+    {"category": "stop", "match": "prefix", "value": "System Reset"},
+    {"category": "maintenance", "match": "prefix", "value": "Maintenance"},
+    {"category": "maintenance", "match": "prefix", "value": "Calibration"},
+    {"category": "alarm", "match": "range", "value": "Error", "min": 0, "max": 999},
+    {"category": "alarm", "match": "regex", "value": r"(?i)\b(alarm|fault)\b"},
+]
+DEFAULT_EVENT_CATEGORY = "other"
+
+# حالة الآلة التي تدل عليها كل فئة في الخط الزمني (الفئات الأخرى لا تغير الحالة)
+TIMELINE_STATES = {"run": "run", "stop": "stop", "alarm": "stop", "maintenance": "maintenance"}
+TIMELINE_STATE_LABELS = {"run": "تشغيل", "stop": "توقف", "maintenance": "صيانة"}
+
+# أعمدة الآلة المعروفة (تُقترح أولاً بهذا الترتيب)؛ SourceFile يضيفه التحميل من المستودع البعيد
+MACHINE_COLUMNS = ["Machine", "SourceFile"]
+NO_MACHINE_OPTION = "بدون (كل البيانات كآلة واحدة)"
+
+# تنسيقات التاريخ والوقت المدعومة في ملفات السجلات (تُجرب بالترتيب)
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%Y/%m/%d']
+TIME_FORMATS = ['%H:%M', '%H:%M:%S']
+
+# عدد الأسطر المقروءة لمعاينة الملف قبل اكتمال التحميل
+PREVIEW_LINES = 2000
+
+# مدة انتظار التحميل قبل عرض المعاينة (بالثواني)
+INGEST_WAIT_SECONDS = 0.5
+
+# الإحصائيات التقديرية: تُعرض أولاً للبيانات التي يتجاوز عدد سجلاتها الحد وعمود الأحداث فيها نصي
+# (عمود الأحداث الفئوي يُعد بسرعة فلا يحتاج تقديراً) حتى تكتمل الإحصائيات الدقيقة
+APPROX_STATS_MIN_ROWS = 2_000_000
+APPROX_SAMPLE_SIZE = 200_000
+
+# تقويم العمل الافتراضي: الورديات والاستراحات والعطلات والصيانة المخططة
+# أيام الأسبوع حسب Python: الاثنين = 0 ... الأحد = 6 (الافتراضي من الأحد إلى الخميس)
+DEFAULT_WORK_CALENDAR = {
+    "shifts": [
+        {"days": [6, 0, 1, 2, 3], "start": "07:00", "end": "15:00"},
+        {"days": [6, 0, 1, 2, 3], "start": "15:00", "end": "23:00"}
+    ],
+    "breaks": [
+        {"start": "12:00", "end": "12:30"},
+        {"start": "19:00", "end": "19:30"}
+    ],
+    "holidays": [],
+    "maintenance": []
+}
+
+# أقسام العرض الرئيسية بالترتيب
+MAIN_SECTIONS = ["📋 عرض البيانات", "📊 الإحصائيات", "⏱ حساب التوقف", "📥 التصدير", "🕒 الخط الزمني", "🚨 رصد الموجات", "🔗 تسلسل الأحداث"]
+
+# صيغ التصدير العمودية: الاسم المعروض -> (امتداد الملف، نوع MIME)
+COLUMNAR_EXPORT_FORMATS = {
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Arrow IPC": ("arrow", "application/vnd.apache.arrow.file"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+}
 
 # تهيئة إعدادات الصفحة
 st.set_page_config(
@@ -79,15 +150,63 @@ st.markdown('<div class="main-header"><h1>📋 نظام عرض وتحليل بي
 with st.sidebar:
     st.markdown("### 📁 تحميل البيانات")
     
-    # خيار رفع الملف
-    uploaded_file = st.file_uploader(
-        "رفع ملف البيانات (TXT أو Excel أو CSV)",
-        type=['txt', 'xlsx', 'xls', 'csv'],
-        help="يمكنك رفع ملف نصي (.txt) أو Excel (.xlsx, .xls) أو CSV"
-    )
+    # اختيار مصدر البيانات
+    data_source = st.radio("مصدر البيانات:", ["رفع ملف", "مستودع بعيد"], horizontal=True)
+    uploaded_file = None
+    remote_files = None
+    
+    if data_source == "رفع ملف":
+        # خيار رفع الملف
+        uploaded_file = st.file_uploader(
+            "رفع ملف البيانات (TXT أو Excel أو CSV أو Parquet أو Arrow)",
+            type=['txt', 'xlsx', 'xls', 'csv', 'gz', 'parquet', 'arrow', 'feather'],
+            help="يمكنك رفع ملف نصي (.txt) أو Excel (.xlsx, .xls) أو CSV (.csv, .csv.gz) أو ملفات مُصدَّرة من التطبيق (.parquet, .arrow)"
+        )
+    else:
+        # جلب ملفات السجلات من خادم ملفات أو مستودع GitHub (تُنزَّل الملفات المتغيرة فقط)
+        remote_kind = st.selectbox("نوع المستودع:", ["خادم ملفات HTTP", "مستودع GitHub"])
+        if remote_kind == "خادم ملفات HTTP":
+            remote_url = st.text_input("رابط صفحة الفهرس:", placeholder="http://server/logs/")
+        else:
+            remote_repo = st.text_input("المستودع (owner/repo):")
+            remote_path = st.text_input("المجلد داخل المستودع:", value="")
+            remote_ref = st.text_input("الفرع (اختياري):", value="")
+        remote_token = st.text_input("رمز الوصول (اختياري):", type="password")
+        mirror_dir = st.text_input("مجلد النسخة المحلية:", value=DEFAULT_MIRROR_DIR)
+        
+        if st.button("⬇️ مزامنة الملفات", use_container_width=True):
+            with st.spinner("جاري مزامنة الملفات..."):
+                try:
+                    token_hosts = (urlparse(remote_url).hostname,) if remote_kind == "خادم ملفات HTTP" else GITHUB_HOSTS
+                    session = create_session(token=remote_token or None, token_hosts=token_hosts)
+                    if remote_kind == "خادم ملفات HTTP":
+                        files = list_http_files(session, remote_url)
+                    else:
+                        files = list_github_files(remote_repo, remote_path, remote_ref or None, remote_token or None)
+                    st.session_state['remote_files'] = sync_files(files, LogMirror(mirror_dir), session)
+                except Exception as e:
+                    st.error(f"❌ خطأ في مزامنة الملفات: {e}")
+        
+        synced_files = st.session_state.get('remote_files', [])
+        if synced_files:
+            status_counts = pd.Series([f['status'] for f in synced_files]).value_counts()
+            st.caption(
+                f"جديد: {status_counts.get('new', 0)} | محدث: {status_counts.get('updated', 0)} | "
+                f"بدون تغيير: {status_counts.get('unchanged', 0)} | أخطاء: {status_counts.get('error', 0)}"
+            )
+            for failed in [f for f in synced_files if f['status'] == 'error']:
+                st.warning(f"⚠️ {failed['name']}: {failed['error']}")
+            
+            available_files = [f for f in synced_files if f['status'] != 'error']
+            selected_names = st.multiselect(
+                "الملفات المستخدمة:",
+                [f['name'] for f in available_files],
+                default=[f['name'] for f in available_files]
+            )
+            remote_files = [f for f in available_files if f['name'] in selected_names] or None
     
     # إعدادات معالجة ملفات TXT
-    if uploaded_file and uploaded_file.name.endswith('.txt'):
+    if (uploaded_file and uploaded_file.name.endswith('.txt')) or remote_files:
         st.markdown("#### ⚙️ إعدادات معالجة ملف TXT")
         txt_separator = st.selectbox(
             "محدد الأعمدة (Separator):",
@@ -119,30 +238,55 @@ with st.sidebar:
     show_stats = st.checkbox("عرض الإحصائيات", value=True)
     show_downtime = st.checkbox("حساب أوقات التوقف", value=True)
     
+    # تقويم العمل لفصل التوقف المخطط عن غير المخطط
+    use_work_calendar = st.checkbox("📅 تطبيق تقويم العمل على التوقف", value=False)
+    if use_work_calendar:
+        with st.expander("📅 تقويم العمل"):
+            work_calendar_text = st.text_area(
+                "التقويم (JSON):",
+                value=json.dumps(DEFAULT_WORK_CALENDAR, ensure_ascii=False, indent=2),
+                height=300,
+                help="shifts و breaks: قوائم فترات يومية (start و end وأيام الأسبوع days)، holidays: تواريخ، maintenance: فترات بـ start و end كاملة"
+            )
+    
+    # واجهة استعلام JSON محلية للأنظمة الأخرى (لوحات MES وتقارير الورديات)
+    enable_query_api = st.checkbox("🌐 تفعيل واجهة الاستعلام المحلية (JSON)", value=False)
+    if enable_query_api:
+        query_api_port = st.number_input("منفذ واجهة الاستعلام:", min_value=1024, max_value=65535, value=8600, step=1)
+
+    # قواعد تصنيف الأحداث إلى فئات (تشغيل / توقف / صيانة / إنذار)
+    with st.expander("🏷️ قواعد تصنيف الأحداث"):
+        event_rules_text = st.text_area(
+            "القواعد (JSON):",
+            value=json.dumps(DEFAULT_EVENT_RULES, ensure_ascii=False, indent=2),
+            height=300,
+            help="كل قاعدة تحتوي على category و match (exact, prefix, range, regex) و value، وقاعدة range تقبل min و max لرقم الكود"
+        )
+
     st.markdown("---")
     st.markdown("#### ℹ️ معلومات:")
     st.info("""
     **مميزات التطبيق:**
-    - رفع ملفات TXT, Excel, CSV
+    - رفع ملفات TXT, Excel, CSV, Parquet, Arrow
+    - جلب السجلات من خادم ملفات أو مستودع GitHub
     - معالجة تلقائية لملفات السجلات
     - عرض كامل للبيانات
     - إحصائيات تفصيلية
     - حساب أوقات التوقف
+    - تصنيف الأحداث إلى فئات
+    - خط زمني للتشغيل والتوقف
+    - رصد موجات الأعطال
+    - تحليل تسلسل الأحداث قبل التوقف
+    - تقليص استهلاك الذاكرة عند التحميل
+    - واجهة استعلام JSON محلية
     - تصدير للعديد من الصيغ
     """)
 
-# دالة لمعالجة ملفات TXT
-def process_txt_file(file_content, separator="Tab (\\t)", skip_lines=0, skip_empty=True, skip_comments=True):
+# دالة لتقسيم أسطر ملف TXT إلى أعمدة
+def parse_txt_lines(lines, separator="Tab (\\t)", skip_empty=True, skip_comments=True):
     """
-    معالجة ملفات TXT وتحويلها إلى DataFrame
+    تحويل أسطر ملف TXT إلى قائمة صفوف من 4 أعمدة (التاريخ، الوقت، الحدث، التفاصيل)
     """
-    # تحويل محتوى الملف إلى أسطر
-    lines = file_content.decode('utf-8').splitlines()
-    
-    # تخطي الأسطر المطلوبة
-    if skip_lines > 0:
-        lines = lines[skip_lines:]
-    
     data = []
     for line in lines:
         # تخطي الأسطر الفارغة إذا كان الخيار مفعل
@@ -173,54 +317,154 @@ def process_txt_file(file_content, separator="Tab (\\t)", skip_lines=0, skip_emp
         cleaned_parts = [part.strip() for part in parts[:4]]
         data.append(cleaned_parts)
     
+    return data
+
+# دالة لمعالجة ملفات TXT
+def process_txt_file(file_content, separator="Tab (\\t)", skip_lines=0, skip_empty=True, skip_comments=True, messages=None):
+    """
+    معالجة ملفات TXT وتحويلها إلى DataFrame (رسائل الحالة تُضاف إلى messages)
+    """
+    messages = [] if messages is None else messages
+    # تحويل محتوى الملف إلى أسطر
+    lines = file_content.decode('utf-8').splitlines()
+    
+    # تخطي الأسطر المطلوبة
+    if skip_lines > 0:
+        lines = lines[skip_lines:]
+    
+    data = parse_txt_lines(lines, separator, skip_empty, skip_comments)
+    
     # إنشاء DataFrame
     if data:
         df = pd.DataFrame(data, columns=["Date", "Time", "Event", "Details"])
         
         # تسجيل معلومات المعالجة
-        st.sidebar.success(f"✅ تم معالجة {len(data)} سجل من ملف TXT")
+        messages.append(('sidebar', 'success', f"✅ تم معالجة {len(data)} سجل من ملف TXT"))
         return df
     else:
-        st.sidebar.error("❌ لم يتم استخراج أي بيانات من الملف")
+        messages.append(('sidebar', 'error', "❌ لم يتم استخراج أي بيانات من الملف"))
+        return None
+
+# دالة لقراءة أول أسطر من محتوى الملف فقط
+def head_bytes(file_content, n_lines):
+    """
+    إرجاع الجزء من محتوى الملف الذي يحتوي على أول n_lines سطر بدون فك ترميز الملف كاملاً
+    """
+    end = 0
+    for _ in range(n_lines):
+        end = file_content.find(b"\n", end) + 1
+        if end == 0:
+            return file_content
+    return file_content[:end]
+
+# دالة لمعاينة الملف المرفوع بسرعة
+def preview_file(file_content, file_name, txt_params=None, max_lines=PREVIEW_LINES):
+    """
+    قراءة أول أسطر الملف بإعدادات TXT الحالية وإرجاع المعاينة وتنسيق التاريخ والعدد التقديري للسجلات
+    """
+    txt_params = txt_params or {}
+    skip_lines = txt_params.get('skip_lines', 0)
+    
+    if file_name.endswith('.txt'):
+        head = head_bytes(file_content, skip_lines + max_lines)
+        lines = head.decode('utf-8', errors='replace').splitlines()[skip_lines:]
+        data = parse_txt_lines(
+            lines,
+            separator=txt_params.get('separator', "Tab (\\t)"),
+            skip_empty=txt_params.get('skip_empty', True),
+            skip_comments=txt_params.get('skip_comments', True)
+        )
+        preview = pd.DataFrame(data, columns=["Date", "Time", "Event", "Details"])
+    elif file_name.endswith('.csv'):
+        head = head_bytes(file_content, max_lines + 1)
+        preview = pd.read_csv(BytesIO(head))
+    else:
+        return None, None, None
+    
+    # تقدير عدد السجلات من متوسط حجم السطر في الجزء المقروء
+    if len(head) >= len(file_content):
+        estimated_rows = len(preview)
+    else:
+        estimated_rows = int(len(preview) * len(file_content) / max(len(head), 1))
+    
+    return preview, detect_date_format(preview), estimated_rows
+
+# دالة لقراءة ملف بيانات حسب نوعه
+def read_data_file(uploaded_file, txt_params=None, messages=None):
+    """
+    قراءة ملف بيانات (مرفوع أو من النسخة المحلية) وتحويله إلى DataFrame حسب امتداده
+    
+    لا تكتب في الصفحة لأنها تُنفذ في الخلفية؛ رسائل الحالة والأخطاء تُضاف إلى messages.
+    """
+    messages = [] if messages is None else messages
+    try:
+        # تحديد نوع الملف وتحويله
+        if uploaded_file.name.endswith('.txt'):
+            if txt_params:
+                df = process_txt_file(
+                    uploaded_file.getvalue(),
+                    separator=txt_params.get('separator', "Tab (\\t)"),
+                    skip_lines=txt_params.get('skip_lines', 0),
+                    skip_empty=txt_params.get('skip_empty', True),
+                    skip_comments=txt_params.get('skip_comments', True),
+                    messages=messages
+                )
+            else:
+                df = process_txt_file(uploaded_file.getvalue(), messages=messages)
+            
+            if df is not None:
+                return df
+        
+        elif uploaded_file.name.endswith('.csv'):
+            df = pd.read_csv(uploaded_file)
+            messages.append(('sidebar', 'success', f"✅ تم تحميل {len(df)} سجل من ملف CSV"))
+            return df
+        
+        # الصيغ المُصدَّرة من التطبيق: تُحمَّل بأنواعها مباشرة بدون تخمين تنسيق التاريخ
+        elif uploaded_file.name.endswith('.parquet'):
+            df = pd.read_parquet(uploaded_file)
+            messages.append(('sidebar', 'success', f"✅ تم تحميل {len(df)} سجل من ملف Parquet"))
+            return df
+        
+        elif uploaded_file.name.endswith(('.arrow', '.feather')):
+            df = pd.read_feather(uploaded_file)
+            messages.append(('sidebar', 'success', f"✅ تم تحميل {len(df)} سجل من ملف Arrow"))
+            return df
+        
+        elif uploaded_file.name.endswith('.csv.gz'):
+            df = pd.read_csv(uploaded_file, compression='gzip', dtype={'Event': 'category'})
+            if 'DateTime' in df.columns:
+                df['DateTime'] = pd.to_datetime(df['DateTime'], format='ISO8601', errors='coerce')
+            messages.append(('sidebar', 'success', f"✅ تم تحميل {len(df)} سجل من ملف CSV مضغوط"))
+            return df
+        
+        elif uploaded_file.name.endswith(('.xlsx', '.xls')):
+            df = pd.read_excel(uploaded_file)
+            messages.append(('sidebar', 'success', f"✅ تم تحميل {len(df)} سجل من ملف Excel"))
+            return df
+        
+        elif uploaded_file.name.endswith('.gz'):
+            raise ValueError("الملفات المضغوطة المدعومة هي ملفات CSV فقط (.csv.gz)")
+        
+        else:
+            raise ValueError(f"صيغة ملف غير مدعومة: {uploaded_file.name}")
+        
+    except Exception as e:
+        messages.append(('sidebar', 'error', f"❌ خطأ في تحميل الملف: {e}"))
         return None
+    
+    return None
 
 # دالة لتحميل البيانات من الملف المرفوع
-@st.cache_data
+# البيانات الخام (أعمدة نصية) تُحفظ لفترة قصيرة فقط؛ النتيجة المضغوطة النهائية تحفظها start_ingest
+@st.cache_data(show_spinner=False, max_entries=1, ttl=600)
 def load_data(uploaded_file=None, use_sample=False, txt_params=None):
     """
-    تحميل البيانات من الملف المرفوع أو استخدام بيانات تجريبية
+    تحميل البيانات من الملف المرفوع أو استخدام بيانات تجريبية مع رسائل الحالة
     """
+    messages = []
     if uploaded_file is not None:
-        try:
-            # تحديد نوع الملف وتحويله
-            if uploaded_file.name.endswith('.txt'):
-                if txt_params:
-                    df = process_txt_file(
-                        uploaded_file.getvalue(),
-                        separator=txt_params.get('separator', "Tab (\\t)"),
-                        skip_lines=txt_params.get('skip_lines', 0),
-                        skip_empty=txt_params.get('skip_empty', True),
-                        skip_comments=txt_params.get('skip_comments', True)
-                    )
-                else:
-                    df = process_txt_file(uploaded_file.getvalue())
-                
-                if df is not None:
-                    return df
-            
-            elif uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-                st.sidebar.success(f"✅ تم تحميل {len(df)} سجل من ملف CSV")
-                return df
-            
-            else:  # Excel files
-                df = pd.read_excel(uploaded_file)
-                st.sidebar.success(f"✅ تم تحميل {len(df)} سجل من ملف Excel")
-                return df
-            
-        except Exception as e:
-            st.sidebar.error(f"❌ خطأ في تحميل الملف: {e}")
-            return None
+        return read_data_file(uploaded_file, txt_params, messages), messages
     
     elif use_sample:
         # إنشاء بيانات تجريبية للعرض
@@ -233,17 +477,164 @@ def load_data(uploaded_file=None, use_sample=False, txt_params=None):
             "Details": [f"تفاصيل السجل رقم {i+1}" for i in range(num_records)]
         }
         df = pd.DataFrame(sample_data)
-        st.sidebar.warning("⚠️ يتم عرض بيانات تجريبية")
-        return df
+        messages.append(('sidebar', 'warning', "⚠️ يتم عرض بيانات تجريبية"))
+        return df, messages
     
     else:
+        return None, messages
+
+# دالة لقراءة قواعد التصنيف من نص JSON
+def parse_event_rules(rules_text):
+    """
+    تحويل نص القواعد إلى قائمة قواعد، مع الرجوع للقواعد الافتراضية عند الخطأ
+    """
+    if not rules_text or not rules_text.strip():
+        return DEFAULT_EVENT_RULES
+    try:
+        rules = json.loads(rules_text)
+        if not isinstance(rules, list):
+            raise ValueError("يجب أن تكون القواعد قائمة")
+        for rule in rules:
+            if not isinstance(rule, dict) or rule.get('match') not in ('exact', 'prefix', 'range', 'regex'):
+                raise ValueError(f"قاعدة غير صالحة: {rule}")
+            if not isinstance(rule.get('category'), str) or not isinstance(rule.get('value', ''), str):
+                raise ValueError(f"يجب أن تكون category و value نصوصاً: {rule}")
+            if rule['match'] == 'range':
+                for bound in ('min', 'max'):
+                    if bound in rule and (isinstance(rule[bound], bool) or not isinstance(rule[bound], (int, float))):
+                        raise ValueError(f"يجب أن تكون {bound} رقماً في قاعدة النطاق: {rule}")
+            if rule['match'] == 'regex':
+                re.compile(rule.get('value', ''))
+        return rules
+    except Exception as e:
+        st.sidebar.error(f"❌ خطأ في قواعد التصنيف، سيتم استخدام القواعد الافتراضية: {e}")
+        return DEFAULT_EVENT_RULES
+
+# دالة لتجميع القواعد في دالة مطابقة واحدة
+def compile_event_rules(rules, default=DEFAULT_EVENT_CATEGORY):
+    """
+    تجميع القواعد في دالة مطابقة واحدة تعيد فئة الحدث (أول قاعدة مطابقة حسب الترتيب)
+    """
+    # التطابق التام عبر قاموس، وباقي القواعد كتعبيرات نمطية مجمعة مسبقاً
+    exact = {}
+    patterns = []
+    for order, rule in enumerate(rules):
+        value = str(rule.get('value', ''))
+        if rule['match'] == 'exact':
+            exact.setdefault(value, (order, rule['category']))
+        elif rule['match'] == 'prefix':
+            patterns.append((order, rule['category'], re.compile(re.escape(value)), None))
+        elif rule['match'] == 'range':
+            bounds = (rule.get('min', float('-inf')), rule.get('max', float('inf')))
+            patterns.append((order, rule['category'], re.compile(re.escape(value) + r"\s*(\d+)\s*$"), bounds))
+        else:
+            patterns.append((order, rule['category'], re.compile(value), 'search'))
+
+    def matcher(event):
+        event = str(event).strip()
+        best_order, best_category = exact.get(event, (len(rules), default))
+        for order, category, pattern, extra in patterns:
+            if order >= best_order:
+                break
+            if extra == 'search':
+                if pattern.search(event):
+                    return category
+            elif extra is None:
+                if pattern.match(event):
+                    return category
+            else:
+                found = pattern.match(event)
+                if found and extra[0] <= int(found.group(1)) <= extra[1]:
+                    return category
+        return best_category
+
+    return matcher
+
+# دالة لتقييم دالة على القيم المميزة فقط ثم نشر النتيجة على كل الصفوف
+def map_unique_events(events, func, missing=None):
+    """
+    تقييم الدالة مرة واحدة لكل قيمة مميزة في العمود ونشر النتائج على الصفوف عبر الأكواد
+    """
+    codes, uniques = pd.factorize(events)
+    results = [func(value) for value in uniques]
+    # الكود -1 يعني قيمة ناقصة، ويشير إلى العنصر الأخير المضاف
+    return np.array(results + [missing], dtype=object)[codes]
+
+# دالة لتصنيف الأحداث إلى فئات
+def classify_events(events, rules=None):
+    """
+    تصنيف عمود الأحداث إلى فئات حسب القواعد وإرجاع عمود من نوع category
+    """
+    matcher = compile_event_rules(rules if rules is not None else DEFAULT_EVENT_RULES)
+    categories = map_unique_events(events, matcher, missing=DEFAULT_EVENT_CATEGORY)
+    return pd.Series(pd.Categorical(categories), index=events.index)
+
+# دالة لحساب فترات التوقف من قناعين (أحداث التوقف وأحداث المرجع)
+def _downtime_from_masks(df_sorted, downtime_mask, reference_mask):
+    """
+    حساب فترات التوقف بإيجاد أول حدث مرجعي بعد كل حدث توقف عبر البحث الثنائي
+    """
+    downtime_events = df_sorted[downtime_mask]
+    reference_times = df_sorted.loc[reference_mask, 'DateTime'].to_numpy()
+
+    if len(downtime_events) == 0 or len(reference_times) == 0:
+        return 0, len(downtime_events), []
+
+    # أقرب حدث مرجعي بعد حدث التوقف (أكبر تماماً من وقت التوقف)
+    starts = downtime_events['DateTime'].to_numpy()
+    positions = np.searchsorted(reference_times, starts, side='right')
+    has_end = positions < len(reference_times)
+
+    stopped = downtime_events[has_end]
+    ends = reference_times[positions[has_end]]
+    minutes = (ends - starts[has_end]) / np.timedelta64(1, 'm')
+    details = stopped['Details'] if 'Details' in stopped.columns else pd.Series('', index=stopped.index)
+
+    downtime_periods = [
+        {
+            'بداية التوقف': start,
+            'نهاية التوقف': end,
+            'المدة (دقائق)': duration,
+            'الحدث': event,
+            'التفاصيل': detail
+        }
+        for start, end, duration, event, detail in zip(
+            stopped['DateTime'], pd.to_datetime(ends), minutes.tolist(), stopped['Event'], details
+        )
+    ]
+
+    return float(minutes.sum()), len(downtime_events), downtime_periods
+
+# دالة لاكتشاف تنسيق التاريخ والوقت
+def detect_date_format(df, sample_size=1000):
+    """
+    تجربة التنسيقات المدعومة على عينة من البيانات وإرجاع التنسيق الذي يحول أكبر عدد من القيم
+    """
+    if df is None or 'Date' not in df.columns or 'Time' not in df.columns or len(df) == 0:
         return None
+    
+    sample = df['Date'].head(sample_size).astype(str) + ' ' + df['Time'].head(sample_size).astype(str)
+    best_format, best_count = None, 0
+    for date_format in DATE_FORMATS:
+        for time_format in TIME_FORMATS:
+            datetime_format = f"{date_format} {time_format}"
+            try:
+                parsed_count = pd.to_datetime(sample, format=datetime_format, errors='coerce').notna().sum()
+            except:
+                continue
+            if parsed_count > best_count:
+                best_format, best_count = datetime_format, parsed_count
+    
+    return best_format
 
 # دالة لتحضير البيانات
-def prepare_data(df):
+def prepare_data(df, messages=None):
     """
-    تحضير البيانات وإنشاء عمود DateTime
+    تحضير البيانات وإنشاء عمود DateTime (التنبيهات تُضاف إلى messages)
+    
+    التصنيف إلى فئات يتم لاحقاً في classify_dataset حتى لا يعيد تعديل القواعد التحميل الكامل.
     """
+    messages = [] if messages is None else messages
     if df is None or len(df) == 0:
         return None
     
@@ -252,23 +643,21 @@ def prepare_data(df):
     # محاولة إنشاء عمود DateTime من Date و Time
     try:
         if 'DateTime' in df_clean.columns:
-            df_clean['DateTime'] = pd.to_datetime(df_clean['DateTime'], errors='coerce')
+            # الملفات المُصدَّرة بصيغ عمودية تحتوي على DateTime جاهز فلا حاجة لإعادة التحويل
+            if not pd.api.types.is_datetime64_any_dtype(df_clean['DateTime']):
+                df_clean['DateTime'] = pd.to_datetime(df_clean['DateTime'], errors='coerce')
         elif 'Date' in df_clean.columns and 'Time' in df_clean.columns:
-            # محاولة تنسيقات مختلفة للتاريخ والوقت
-            for date_format in ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%Y/%m/%d']:
-                try:
-                    df_clean['DateTime'] = pd.to_datetime(
-                        df_clean['Date'].astype(str) + ' ' + df_clean['Time'].astype(str),
-                        format=f"{date_format} %H:%M",
-                        errors='coerce'
-                    )
-                    if not df_clean['DateTime'].isna().all():
-                        break
-                except:
-                    continue
+            # اكتشاف التنسيق من عينة ثم تحويل كل البيانات مرة واحدة
+            datetime_format = detect_date_format(df_clean)
+            if datetime_format:
+                df_clean['DateTime'] = pd.to_datetime(
+                    df_clean['Date'].astype(str) + ' ' + df_clean['Time'].astype(str),
+                    format=datetime_format,
+                    errors='coerce'
+                )
             
             # إذا فشلت المحاولات السابقة، استخدم التحويل العام
-            if df_clean['DateTime'].isna().all() or 'DateTime' not in df_clean.columns:
+            if 'DateTime' not in df_clean.columns or df_clean['DateTime'].isna().all():
                 df_clean['DateTime'] = pd.to_datetime(
                     df_clean['Date'].astype(str) + ' ' + df_clean['Time'].astype(str),
                     errors='coerce'
@@ -283,13 +672,77 @@ def prepare_data(df):
         removed_count = original_count - len(df_clean)
         
         if removed_count > 0:
-            st.info(f"⚠️ تم إزالة {removed_count} سجل بسبب تاريخ/وقت غير صالح")
+            messages.append(('main', 'info', f"⚠️ تم إزالة {removed_count} سجل بسبب تاريخ/وقت غير صالح"))
         
     except Exception as e:
-        st.warning(f"⚠️ تعذر إنشاء عمود التاريخ والوقت: {e}")
+        messages.append(('main', 'warning', f"⚠️ تعذر إنشاء عمود التاريخ والوقت: {e}"))
     
     return df_clean
 
+# دالة لحساب استهلاك الذاكرة لكل عمود
+def memory_usage_report(df):
+    """
+    نوع كل عمود وحجمه الفعلي في الذاكرة (بما في ذلك محتوى النصوص) بالميغابايت
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    return pd.DataFrame({
+        'العمود': df.columns,
+        'النوع': [str(dtype) for dtype in df.dtypes],
+        'الذاكرة (MB)': (usage / 1024 ** 2).to_numpy()
+    })
+
+# دالة لتقليص أنواع الأعمدة بعد التحضير
+def compact_dataframe(df, category_ratio=0.5):
+    """
+    تقليل حجم البيانات في الذاكرة وإرجاع البيانات المقلصة مع تقرير الذاكرة قبل وبعد
+    
+    - حذف عمودي Date و Time لأن DateTime يحتوي على نفس المعلومة
+    - تصغير الأعمدة الرقمية إلى أصغر نوع يحفظ القيم بدون فقد
+    - ترميز النصوص قليلة التنوع كفئات والباقي كنصوص Arrow متصلة في الذاكرة
+    """
+    before = memory_usage_report(df)
+    df = df.copy()
+    
+    if 'DateTime' in df.columns and pd.api.types.is_datetime64_any_dtype(df['DateTime']):
+        df = df.drop(columns=[c for c in ('Date', 'Time') if c in df.columns])
+        df = df[['DateTime'] + [c for c in df.columns if c != 'DateTime']]
+    
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            downcast = 'unsigned' if len(values) and values.min() >= 0 else 'integer'
+            df[column] = pd.to_numeric(values, downcast=downcast)
+        elif pd.api.types.is_float_dtype(values):
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow.to_numpy(dtype=np.float64), values.to_numpy(dtype=np.float64), equal_nan=True):
+                df[column] = narrow
+        elif values.dtype == object:
+            sample = values.iloc[:10000]
+            # عمود بأنواع مختلطة (مثل أرقام ونصوص من Excel) يبقى كما هو
+            if pd.api.types.infer_dtype(sample, skipna=True) != 'string':
+                continue
+            # عينة سريعة تستبعد النصوص شبه الفريدة (مثل التفاصيل) قبل التكويد الكامل
+            if len(values) <= len(sample) or sample.nunique() <= 0.9 * len(sample):
+                # تكويد واحد يحدد التنوع ويبني الفئات مباشرة بدون مرور ثانٍ على النصوص
+                codes, uniques = pd.factorize(values)
+                if len(uniques) <= category_ratio * len(values):
+                    # ترتيب الفئات أبجدياً (مثل ترتيب النصوص) بترتيب القيم المميزة فقط
+                    order = np.argsort(np.asarray(uniques, dtype=object), kind='stable')
+                    rank = np.empty(len(order), dtype=np.int64)
+                    rank[order] = np.arange(len(order))
+                    df[column] = pd.Categorical.from_codes(np.where(codes >= 0, rank[codes], -1), uniques[order])
+                    continue
+            try:
+                df[column] = values.astype("string[pyarrow]")
+            except (ImportError, TypeError, ValueError):
+                pass
+    
+    after = memory_usage_report(df)
+    report = before.merge(after, on='العمود', how='left', suffixes=(' قبل', ' بعد'))
+    return df, report
+
 # دالة لحساب مدة التوقف
 def calculate_downtime(df, event_name, reference_event="Automatic mode"):
     """
@@ -301,42 +754,18 @@ def calculate_downtime(df, event_name, reference_event="Automatic mode"):
     # فرز البيانات حسب الوقت
     df_sorted = df.sort_values('DateTime').reset_index(drop=True)
     
-    # البحث عن أحداث التوقف وأحداث المرجع
-    downtime_events = df_sorted[df_sorted['Event'].str.contains(event_name, case=False, na=False)]
-    reference_events = df_sorted[df_sorted['Event'].str.contains(reference_event, case=False, na=False)]
-    
-    if len(downtime_events) == 0 or len(reference_events) == 0:
-        return 0, len(downtime_events), []
-    
-    # حساب مدة كل توقف
-    downtime_periods = []
-    total_downtime = timedelta()
-    
-    for idx, event in downtime_events.iterrows():
-        # البحث عن أقرب حدث مرجعي بعد حدث التوقف
-        next_ref = reference_events[reference_events['DateTime'] > event['DateTime']]
-        
-        if not next_ref.empty:
-            downtime_start = event['DateTime']
-            downtime_end = next_ref.iloc[0]['DateTime']
-            duration = downtime_end - downtime_start
-            
-            downtime_periods.append({
-                'بداية التوقف': downtime_start,
-                'نهاية التوقف': downtime_end,
-                'المدة (دقائق)': duration.total_seconds() / 60,
-                'الحدث': event['Event'],
-                'التفاصيل': event.get('Details', '')
-            })
-            
-            total_downtime += duration
+    # البحث عن أحداث التوقف وأحداث المرجع (تطابق تام بدون حساسية لحالة الأحرف، مرة واحدة لكل حدث مميز)
+    event_name = str(event_name).strip().lower()
+    reference_event = str(reference_event).strip().lower()
+    downtime_mask = map_unique_events(df_sorted['Event'], lambda x: str(x).strip().lower() == event_name, missing=False)
+    reference_mask = map_unique_events(df_sorted['Event'], lambda x: str(x).strip().lower() == reference_event, missing=False)
     
-    return total_downtime.total_seconds() / 60, len(downtime_events), downtime_periods
+    return _downtime_from_masks(df_sorted, downtime_mask.astype(bool), reference_mask.astype(bool))
 
 # دالة لحساب مدة التوقف لمجموعة أحداث
-def calculate_group_downtime(df, event_list, reference_event="Automatic mode"):
+def calculate_group_downtime(df, event_list, reference_event="Automatic mode", by_category=False):
     """
-    حساب إجمالي مدة التوقف لمجموعة أحداث
+    حساب إجمالي مدة التوقف لمجموعة أحداث أو لمجموعة فئات (by_category)
     """
     if df is None or 'DateTime' not in df.columns:
         return 0, 0, []
@@ -344,137 +773,1853 @@ def calculate_group_downtime(df, event_list, reference_event="Automatic mode"):
     # فرز البيانات حسب الوقت
     df_sorted = df.sort_values('DateTime').reset_index(drop=True)
     
-    # البحث عن أحداث التوقف (أي من الأحداث في القائمة)
-    downtime_events = df_sorted[df_sorted['Event'].apply(lambda x: any(str(event) in str(x) for event in event_list))]
-    reference_events = df_sorted[df_sorted['Event'].str.contains(reference_event, case=False, na=False)]
-    
-    if len(downtime_events) == 0 or len(reference_events) == 0:
-        return 0, len(downtime_events), []
-    
-    # حساب مدة كل توقف
-    downtime_periods = []
-    total_downtime = timedelta()
-    
-    for idx, event in downtime_events.iterrows():
-        # البحث عن أقرب حدث مرجعي بعد حدث التوقف
-        next_ref = reference_events[reference_events['DateTime'] > event['DateTime']]
-        
-        if not next_ref.empty:
-            downtime_start = event['DateTime']
-            downtime_end = next_ref.iloc[0]['DateTime']
-            duration = downtime_end - downtime_start
-            
-            downtime_periods.append({
-                'بداية التوقف': downtime_start,
-                'نهاية التوقف': downtime_end,
-                'المدة (دقائق)': duration.total_seconds() / 60,
-                'الحدث': event['Event'],
-                'التفاصيل': event.get('Details', '')
-            })
-            
-            total_downtime += duration
+    # البحث عن أحداث التوقف (أي من الأحداث أو الفئات في القائمة)
+    if by_category:
+        if 'Category' not in df_sorted.columns:
+            return 0, 0, []
+        downtime_mask = df_sorted['Category'].isin(event_list).to_numpy()
+    else:
+        selected = {str(event).strip() for event in event_list}
+        downtime_mask = map_unique_events(df_sorted['Event'], lambda x: str(x).strip() in selected, missing=False)
+    reference_event = str(reference_event).strip().lower()
+    reference_mask = map_unique_events(df_sorted['Event'], lambda x: str(x).strip().lower() == reference_event, missing=False)
     
-    return total_downtime.total_seconds() / 60, len(downtime_events), downtime_periods
+    return _downtime_from_masks(df_sorted, downtime_mask.astype(bool), reference_mask.astype(bool))
 
-# دالة لتحويل DataFrame إلى Excel وتنزيله
-def convert_to_excel_download(df, filename="organized_data.xlsx"):
+# دالة لدمج الفترات المتداخلة
+def merge_intervals(starts, ends):
     """
-    تحويل DataFrame إلى ملف Excel وتوفيره للتنزيل
+    دمج الفترات المتداخلة أو المتلاصقة وإرجاع بدايات ونهايات مرتبة غير متداخلة
     """
-    try:
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Data')
-        excel_data = output.getvalue()
-        
-        b64 = base64.b64encode(excel_data).decode()
-        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="{filename}">📥 انقر للتحميل</a>'
-        return href
-    except Exception as e:
-        st.error(f"❌ خطأ في تحويل الملف: {e}")
-        return None
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    new_interval = np.r_[True, starts[1:] > ends[:-1]]
+    last_of_interval = np.r_[np.flatnonzero(new_interval)[1:] - 1, len(ends) - 1]
+    return starts[new_interval], ends[last_of_interval]
 
-# تحضير معاملات ملف TXT إذا كان موجوداً
-txt_params = None
-if uploaded_file and uploaded_file.name.endswith('.txt'):
-    txt_params = {
-        'separator': txt_separator,
-        'skip_lines': int(skip_lines),
-        'skip_empty': skip_empty_lines,
-        'skip_comments': skip_comments
-    }
+# دالة لحساب الزمن المغطى بالفترات حتى كل نقطة زمنية
+def cumulative_coverage(starts, ends, points):
+    """
+    حساب مجموع طول الفترات (مدمجة ومرتبة) الواقع قبل كل نقطة، بالبحث الثنائي
+    """
+    points = np.asarray(points, dtype=np.int64)
+    if len(starts) == 0:
+        return np.zeros(len(points), dtype=np.int64)
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    before = np.r_[0, np.cumsum(ends - starts)]
+    k = np.searchsorted(starts, points, side='right') - 1
+    inside = np.clip(points - starts[np.maximum(k, 0)], 0, (ends - starts)[np.maximum(k, 0)])
+    return np.where(k >= 0, before[np.maximum(k, 0)] + inside, 0)
 
-# تحميل البيانات
-df_raw = load_data(uploaded_file, use_sample_data, txt_params)
+# دالة لمعرفة النقاط الواقعة داخل فترات مدمجة
+def _covers(intervals, points):
+    """
+    إرجاع قناع للنقاط الواقعة داخل الفترات (مدمجة ومرتبة)
+    """
+    starts, ends = intervals
+    if len(starts) == 0:
+        return np.zeros(len(points), dtype=bool)
+    k = np.searchsorted(starts, points, side='right') - 1
+    return (k >= 0) & (points < ends[np.maximum(k, 0)])
 
-# تحضير البيانات
-if df_raw is not None:
-    df = prepare_data(df_raw)
-    
-    # إظهار معلومات الملف المرفوع
-    if uploaded_file:
-        st.markdown(f"""
-        <div class="file-info">
-            <h4>📄 معلومات الملف المرفوع</h4>
-            <p><strong>اسم الملف:</strong> {uploaded_file.name}</p>
-            <p><strong>نوع الملف:</strong> {uploaded_file.type if hasattr(uploaded_file, 'type') else 'غير معروف'}</p>
-            <p><strong>عدد السجلات:</strong> {len(df)}</p>
-            <p><strong>الأعمدة:</strong> {', '.join(df.columns.tolist())}</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # زر لتحويل الملف المعالج إلى Excel
-        if st.button("💾 حفظ البيانات المعالجة كملف Excel", key="save_processed"):
-            download_link = convert_to_excel_download(df, f"processed_{uploaded_file.name.replace('.txt', '.xlsx')}")
-            if download_link:
-                st.markdown(download_link, unsafe_allow_html=True)
-                st.success("✅ تم تجهيز ملف Excel للتحميل")
-else:
-    df = None
+# دالة لقراءة تقويم العمل من نص JSON
+def parse_work_calendar(calendar_text):
+    """
+    تحويل نص تقويم العمل إلى قاموس موحد، مع الرجوع للتقويم الافتراضي عند الخطأ
+    """
+    if not calendar_text or not calendar_text.strip():
+        return normalize_work_calendar(DEFAULT_WORK_CALENDAR)
+    try:
+        return normalize_work_calendar(json.loads(calendar_text))
+    except Exception as e:
+        st.sidebar.error(f"❌ خطأ في تقويم العمل، سيتم استخدام التقويم الافتراضي: {e}")
+        return normalize_work_calendar(DEFAULT_WORK_CALENDAR)
 
-# الرسالة الرئيسية إذا لم يتم تحميل بيانات
-if df is None or len(df) == 0:
-    st.markdown("""
-    <div class="upload-box">
-        <h3>📁 لم يتم تحميل أي بيانات</h3>
-        <p>يرجى رفع ملف بيانات (TXT أو Excel أو CSV) من الشريط الجانبي</p>
-        <p>أو تفعيل خيار "استخدام بيانات تجريبية"</p>
-        
-        <h4>📝 معلومات عن ملفات TXT:</h4>
-        <p>التطبيق يدعم معالجة ملفات السجلات النصية التي تحتوي على:</p>
-        <ul>
-            <li>أعمدة مفصولة بـ Tab أو فاصلة أو فاصلة منقوطة</li>
-            <li>التنسيق: التاريخ | الوقت | الحدث | التفاصيل</li>
-            <li>يمكن تخطي الأسطر الأولى أو الفارغة</li>
-        </ul>
-    </div>
-    """, unsafe_allow_html=True)
-    st.stop()
+# دالة لقراءة وقت من اليوم بأحد تنسيقات الوقت المدعومة
+def _parse_clock(value):
+    """
+    تحويل وقت مثل 07:00 أو 07:00:00 إلى الصيغة الموحدة HH:MM:SS
+    """
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(str(value).strip(), time_format).strftime('%H:%M:%S')
+        except ValueError:
+            continue
+    raise ValueError(f"وقت غير صالح: {value}")
 
-# قسم العرض الرئيسي
-tab1, tab2, tab3, tab4 = st.tabs(["📋 عرض البيانات", "📊 الإحصائيات", "⏱ حساب التوقف", "📥 التصدير"])
+# دالة للتحقق من عناصر التقويم وتوحيد صيغها
+def normalize_work_calendar(calendar):
+    """
+    التحقق من كل وردية واستراحة وعطلة وفترة صيانة وتوحيد صيغ الأوقات والتواريخ
+    """
+    if not isinstance(calendar, dict) or not calendar.get('shifts'):
+        raise ValueError("يجب أن يحتوي التقويم على وردية واحدة على الأقل (shifts)")
+    
+    def daily(items, name):
+        if not isinstance(items, list):
+            raise ValueError(f"يجب أن تكون {name} قائمة")
+        result = []
+        for item in items:
+            if not isinstance(item, dict) or 'start' not in item or 'end' not in item:
+                raise ValueError(f"عنصر غير صالح في {name} (يجب أن يحتوي على start و end): {item}")
+            days = item.get('days', list(range(7)))
+            if not isinstance(days, list) or not all(isinstance(d, int) and not isinstance(d, bool) and 0 <= d <= 6 for d in days):
+                raise ValueError(f"أيام غير صالحة في {name} (أرقام من 0 إلى 6): {item}")
+            result.append({'days': days, 'start': _parse_clock(item['start']), 'end': _parse_clock(item['end'])})
+        return result
+    
+    holidays = calendar.get('holidays', [])
+    if not isinstance(holidays, list):
+        raise ValueError("يجب أن تكون holidays قائمة تواريخ")
+    
+    maintenance = []
+    for item in calendar.get('maintenance', []):
+        if not isinstance(item, dict) or 'start' not in item or 'end' not in item:
+            raise ValueError(f"فترة صيانة غير صالحة (يجب أن تحتوي على start و end): {item}")
+        start, end = pd.Timestamp(item['start']), pd.Timestamp(item['end'])
+        if pd.isna(start) or pd.isna(end) or end <= start:
+            raise ValueError(f"فترة صيانة غير صالحة (يجب أن تكون end بعد start): {item}")
+        maintenance.append({'start': start.isoformat(), 'end': end.isoformat()})
+    
+    return {
+        'shifts': daily(calendar['shifts'], 'shifts'),
+        'breaks': daily(calendar.get('breaks', []), 'breaks'),
+        'holidays': [pd.Timestamp(day).date().isoformat() for day in holidays],
+        'maintenance': maintenance
+    }
 
-# إنشاء df_filtered كنسخة من df للاستخدام في جميع الأقسام
-df_filtered = df.copy()
+# دالة لتكرار فترة يومية على أيام النطاق
+def _daily_intervals(days, weekdays, item):
+    """
+    إنشاء فترة لكل يوم من أيام الأسبوع المحددة (الفترات التي تنتهي قبل بدايتها تمتد لليوم التالي)
+    """
+    selected = days[np.isin(weekdays, item.get('days', list(range(7))))]
+    start = pd.Timedelta(item['start'])
+    end = pd.Timedelta(item['end'])
+    if end <= start:
+        end += pd.Timedelta(days=1)
+    return (selected + start).asi8, (selected + end).asi8
 
-with tab1:
-    st.header("📋 عرض البيانات التفصيلي")
+# دالة لبناء فترات العمل والصيانة المخططة من التقويم
+def build_calendar_intervals(calendar, range_start, range_end):
+    """
+    بناء فترات العمل الفعلية (الورديات ناقص الاستراحات والعطلات والصيانة المخططة) وفترات الصيانة
+    """
+    days = pd.date_range(pd.Timestamp(range_start).normalize() - pd.Timedelta(days=1),
+                         pd.Timestamp(range_end).normalize() + pd.Timedelta(days=1), freq='D')
+    # أيام الأسبوع حسب Python: الاثنين = 0 ... الأحد = 6
+    weekdays = days.weekday
     
-    # إعدادات عرض البيانات
-    col1, col2, col3 = st.columns(3)
+    shift_parts = [_daily_intervals(days, weekdays, shift) for shift in calendar.get('shifts', [])]
+    break_parts = [_daily_intervals(days, weekdays, item) for item in calendar.get('breaks', [])]
+    holidays = pd.DatetimeIndex(pd.to_datetime(calendar.get('holidays', []))).normalize()
+    maintenance = calendar.get('maintenance', [])
+    maintenance_starts = pd.DatetimeIndex(pd.to_datetime([m['start'] for m in maintenance])).asi8
+    maintenance_ends = pd.DatetimeIndex(pd.to_datetime([m['end'] for m in maintenance])).asi8
     
-    with col1:
-        rows_to_show = st.slider("عدد الصفوف للعرض:", 10, 1000, 100, 10)
+    def union(parts):
+        starts = np.concatenate([p[0] for p in parts]) if parts else np.array([], dtype=np.int64)
+        ends = np.concatenate([p[1] for p in parts]) if parts else np.array([], dtype=np.int64)
+        return merge_intervals(starts, ends)
     
-    with col2:
-        # الحصول على أسماء الأعمدة المتاحة
-        available_columns = df.columns.tolist()
-        sort_column = st.selectbox("ترتيب البيانات حسب:", available_columns)
+    shifts = union(shift_parts)
+    maintenance_windows = merge_intervals(maintenance_starts, maintenance_ends)
+    excluded = union(break_parts + [(holidays.asi8, (holidays + pd.Timedelta(days=1)).asi8), maintenance_windows])
     
-    with col3:
-        sort_order = st.radio("نوع الترتيب:", ["تصاعدي", "تنازلي"], horizontal=True)
+    # فترات العمل = الورديات ناقص المستثنى: تقسيم الزمن عند كل حد وتصنيف كل جزء من منتصفه
+    points = np.unique(np.concatenate([shifts[0], shifts[1], excluded[0], excluded[1]]))
+    if len(points) < 2:
+        return {'working': shifts, 'maintenance': maintenance_windows}
+    middles = points[:-1] + (points[1:] - points[:-1]) // 2
+    in_shift = _covers(shifts, middles)
+    in_excluded = _covers(excluded, middles)
+    working = in_shift & ~in_excluded
     
-    # تصفية حسب التاريخ إذا كان موجوداً
+    return {
+        'working': merge_intervals(points[:-1][working], points[1:][working]),
+        'maintenance': maintenance_windows
+    }
+
+# دالة لتقسيم فترات التوقف إلى مخطط وغير مخطط حسب تقويم العمل
+def split_downtime_by_calendar(periods_df, calendar):
+    """
+    تقاطع كل فترة توقف مع تقويم العمل دفعة واحدة: غير المخطط هو ما وقع داخل وقت العمل
+    """
+    if periods_df is None or len(periods_df) == 0:
+        return periods_df
+    
+    starts = pd.to_datetime(periods_df['بداية التوقف']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+    ends = pd.to_datetime(periods_df['نهاية التوقف']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+    intervals = build_calendar_intervals(calendar, pd.Timestamp(starts.min()), pd.Timestamp(ends.max()))
+    
+    # الزمن المشترك مع الفترات = التغطية التراكمية عند النهاية ناقص التغطية عند البداية
+    working_ns = cumulative_coverage(*intervals['working'], ends) - cumulative_coverage(*intervals['working'], starts)
+    maintenance_ns = cumulative_coverage(*intervals['maintenance'], ends) - cumulative_coverage(*intervals['maintenance'], starts)
+    minute_ns = 60 * 10**9
+    
+    result = periods_df.copy()
+    result['توقف غير مخطط (دقائق)'] = working_ns / minute_ns
+    result['توقف مخطط (دقائق)'] = (ends - starts - working_ns) / minute_ns
+    result['صيانة مخططة (دقائق)'] = maintenance_ns / minute_ns
+    return result
+
+# دالة لحساب مؤشرات الاعتمادية (MTBF و MTTR والإتاحية)
+def calculate_reliability(df, event_list, reference_event="Automatic mode", by_category=False):
+    """
+    حساب متوسط الوقت بين الأعطال ومتوسط وقت الإصلاح ونسبة الإتاحية من فترات التوقف
+    """
+    total_minutes, event_count, periods = calculate_group_downtime(df, event_list, reference_event, by_category=by_category)
+    observed_minutes = 0.0
+    if df is not None and 'DateTime' in df.columns and len(df) > 0:
+        observed_minutes = (df['DateTime'].max() - df['DateTime'].min()).total_seconds() / 60
+    
+    # دمج فترات التوقف المتداخلة (عدة أعطال قبل نفس حدث التشغيل) حتى لا تُحسب مرتين
+    failures, downtime_minutes = 0, 0.0
+    if periods:
+        merged_starts, merged_ends = merge_intervals(
+            pd.to_datetime([p['بداية التوقف'] for p in periods]).to_numpy(),
+            pd.to_datetime([p['نهاية التوقف'] for p in periods]).to_numpy()
+        )
+        failures = len(merged_starts)
+        downtime_minutes = float(((merged_ends - merged_starts) / np.timedelta64(1, 'm')).sum())
+    
+    uptime_minutes = max(observed_minutes - downtime_minutes, 0.0)
+    return {
+        'stop_events': event_count,
+        'failures': failures,
+        'downtime_minutes': downtime_minutes,
+        'observed_minutes': observed_minutes,
+        'uptime_minutes': uptime_minutes,
+        'mttr_minutes': downtime_minutes / failures if failures else None,
+        'mtbf_minutes': uptime_minutes / failures if failures else None,
+        'availability': uptime_minutes / observed_minutes if observed_minutes else None
+    }
+
+# دالة لتحديد عمود الآلة المستخدم في التقسيم
+def machine_column(df, machine_col=None):
+    """
+    إرجاع عمود الآلة إذا كان موجوداً في البيانات، أو None لمعاملة كل البيانات كآلة واحدة
+    """
+    return machine_col if machine_col and machine_col in df.columns else None
+
+# دالة لاقتراح الأعمدة التي يمكن استخدامها كعمود الآلة
+def machine_column_options(df):
+    """
+    الأعمدة النصية أو الفئوية غير الأعمدة الأساسية، مع تقديم الأعمدة المعروفة (Machine ثم SourceFile)
+    """
+    candidates = [
+        c for c in df.columns
+        if c not in ('Date', 'Time', 'DateTime', 'Event', 'Category', 'Details')
+        and (isinstance(df[c].dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(df[c]) or pd.api.types.is_string_dtype(df[c]))
+    ]
+    known = [c for c in MACHINE_COLUMNS if c in candidates]
+    return known + [c for c in candidates if c not in known]
+
+# دالة لبناء فترات الحالة (تشغيل / توقف / صيانة) لكل آلة
+def build_state_intervals(df, machine_col=None):
+    """
+    تحويل تسلسل الأحداث إلى فترات حالة متتالية لكل آلة حسب فئة الحدث
+    """
+    columns = ['machine', 'state', 'start', 'end', 'events']
+    if df is None or 'DateTime' not in df.columns or 'Category' not in df.columns:
+        return pd.DataFrame(columns=columns)
+    
+    machine_col = machine_column(df, machine_col)
+    sort_cols = ([machine_col] if machine_col else []) + ['DateTime']
+    data = df.dropna(subset=['DateTime']).sort_values(sort_cols, kind='stable')
+    machine = data[machine_col].astype(str).to_numpy() if machine_col else np.full(len(data), "الكل", dtype=object)
+    
+    # الأحداث التي لا تغير الحالة (other) ترث حالة آخر حدث سابق على نفس الآلة
+    state = data['Category'].astype(object).map(TIMELINE_STATES)
+    state = state.groupby(machine).ffill()
+    valid = state.notna().to_numpy()
+    
+    m = machine[valid]
+    s = state.to_numpy()[valid]
+    t = data['DateTime'].to_numpy()[valid]
+    if len(t) == 0:
+        return pd.DataFrame(columns=columns)
+    
+    # بداية فترة جديدة عند تغير الحالة أو الآلة
+    change = np.r_[True, (s[1:] != s[:-1]) | (m[1:] != m[:-1])]
+    starts_idx = np.flatnonzero(change)
+    next_idx = np.r_[starts_idx[1:], len(t)]
+    
+    # نهاية كل فترة هي بداية الفترة التالية، أو آخر حدث للآلة نفسها
+    block_end = np.r_[np.flatnonzero(m[1:] != m[:-1]), len(t) - 1]
+    own_block_end = block_end[np.searchsorted(block_end, starts_idx)]
+    ends_idx = np.minimum(next_idx, own_block_end)
+    # آخر فترة للآلة تشمل حدثها الأخير، والفترات الأخرى تنتهي قبل بداية الفترة التالية
+    last_of_machine = next_idx > own_block_end
+    
+    return pd.DataFrame({
+        'machine': m[starts_idx],
+        'state': s[starts_idx],
+        'start': t[starts_idx],
+        'end': t[ends_idx],
+        'events': ends_idx - starts_idx + last_of_machine
+    })
+
+# دالة لتقليل دقة الفترات حسب عرض الشاشة
+def downsample_intervals(intervals, range_start, range_end, n_buckets=1000):
+    """
+    تقليص الفترات داخل النطاق المعروض إلى ما يناسب عدد الأعمدة (البكسلات) المحدد
+    """
+    range_start, range_end = pd.Timestamp(range_start), pd.Timestamp(range_end)
+    visible = intervals[(intervals['end'] >= range_start) & (intervals['start'] <= range_end)].copy()
+    if visible.empty or range_end <= range_start:
+        return visible
+    
+    visible['start'] = visible['start'].clip(lower=range_start)
+    visible['end'] = visible['end'].clip(upper=range_end)
+    bucket_width = (range_end - range_start) / n_buckets
+    
+    # الفترات الأطول من عمود واحد تُرسم كما هي
+    is_long = (visible['end'] - visible['start']) >= bucket_width
+    long_intervals = visible[is_long]
+    
+    # الفترات القصيرة تُجمع في عمود واحد بالحالة الغالبة (الأطول مدة) داخله
+    short = visible[~is_long].copy()
+    if short.empty:
+        return long_intervals.reset_index(drop=True)
+    short['bucket'] = ((short['start'] - range_start) // bucket_width).clip(upper=n_buckets - 1).astype(int)
+    short['duration'] = short['end'] - short['start']
+    
+    grouped = short.groupby(['machine', 'bucket', 'state'], sort=False).agg(
+        duration=('duration', 'sum'), events=('events', 'sum')
+    ).reset_index()
+    events_per_bucket = grouped.groupby(['machine', 'bucket'])['events'].transform('sum')
+    grouped['events'] = events_per_bucket
+    dominant = grouped.sort_values('duration', kind='stable').drop_duplicates(['machine', 'bucket'], keep='last')
+    dominant = dominant.assign(
+        start=range_start + dominant['bucket'] * bucket_width,
+        end=range_start + (dominant['bucket'] + 1) * bucket_width
+    )
+    
+    return pd.concat(
+        [long_intervals, dominant[['machine', 'state', 'start', 'end', 'events']]],
+        ignore_index=True
+    )
+
+# دالة لتقليل دقة علامات الأحداث حسب عرض الشاشة
+def downsample_markers(df, range_start, range_end, n_buckets=1000, categories=('alarm', 'stop', 'maintenance'), machine_col=None):
+    """
+    تجميع علامات الأحداث داخل النطاق المعروض في أعمدة زمنية مع عدد الأحداث في كل عمود
+    """
+    columns = ['machine', 'Category', 'time', 'count', 'Event']
+    if df is None or 'DateTime' not in df.columns or 'Category' not in df.columns:
+        return pd.DataFrame(columns=columns)
+    
+    range_start, range_end = pd.Timestamp(range_start), pd.Timestamp(range_end)
+    in_range = df['DateTime'].between(range_start, range_end) & df['Category'].isin(categories)
+    machine_col = machine_column(df, machine_col)
+    events = df.loc[in_range, ['DateTime', 'Category', 'Event'] + ([machine_col] if machine_col else [])]
+    if events.empty or range_end <= range_start:
+        return pd.DataFrame(columns=columns)
+    
+    bucket_width = (range_end - range_start) / n_buckets
+    machine = events[machine_col].astype(str) if machine_col else pd.Series("الكل", index=events.index)
+    bucket = ((events['DateTime'] - range_start) // bucket_width).clip(upper=n_buckets - 1)
+    
+    markers = events.groupby([machine.rename('machine'), bucket.rename('bucket'), events['Category'].astype(str)], sort=False).agg(
+        time=('DateTime', 'min'), count=('DateTime', 'size'), Event=('Event', 'first')
+    ).reset_index()
+    
+    return markers[columns]
+
+# دالة لرسم الخط الزمني للتشغيل والتوقف
+def build_timeline_chart(bars, markers):
+    """
+    إنشاء مخطط Gantt للفترات مع علامات الأحداث
+    """
+    bars = bars.assign(state_label=bars['state'].map(TIMELINE_STATE_LABELS))
+    gantt = alt.Chart(bars).mark_bar(height=18).encode(
+        x=alt.X('start:T', title='الوقت'),
+        x2='end:T',
+        y=alt.Y('machine:N', title='الآلة'),
+        color=alt.Color('state_label:N', title='الحالة'),
+        tooltip=[
+            alt.Tooltip('state_label:N', title='الحالة'),
+            alt.Tooltip('start:T', title='من', format='%Y-%m-%d %H:%M'),
+            alt.Tooltip('end:T', title='إلى', format='%Y-%m-%d %H:%M'),
+            alt.Tooltip('events:Q', title='عدد الأحداث')
+        ]
+    )
+    
+    if markers.empty:
+        return gantt.properties(height=120 + 40 * bars['machine'].nunique())
+    
+    points = alt.Chart(markers).mark_point(filled=True, yOffset=-14).encode(
+        x='time:T',
+        y='machine:N',
+        shape=alt.Shape('Category:N', title='نوع الحدث'),
+        size=alt.Size('count:Q', title='عدد الأحداث', scale=alt.Scale(range=[20, 300])),
+        color=alt.value('#333333'),
+        tooltip=[
+            alt.Tooltip('Category:N', title='الفئة'),
+            alt.Tooltip('Event:N', title='الحدث'),
+            alt.Tooltip('time:T', title='الوقت', format='%Y-%m-%d %H:%M'),
+            alt.Tooltip('count:Q', title='العدد')
+        ]
+    )
+    
+    return (gantt + points).properties(height=120 + 40 * bars['machine'].nunique())
+
+# دالة لحساب عدد الأحداث في نافذة زمنية متحركة لكل مجموعة
+def rolling_event_counts(times, group_codes, window_minutes=10):
+    """
+    حساب عدد أحداث كل مجموعة خلال النافذة (t - window, t] لكل حدث بدون حلقات على الصفوف
+    
+    يجب أن تكون البيانات مرتبة حسب المجموعة ثم الوقت. يمكن استخدامها في وضع المتابعة
+    الحية بتمرير الأحداث الجديدة مسبوقة بأحداث آخر نافذة زمنية فقط.
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    group_codes = np.asarray(group_codes)
+    counts = np.empty(len(times), dtype=np.int64)
+    if len(times) == 0:
+        return counts
+    
+    window = np.timedelta64(int(window_minutes * 60), 's')
+    # كل مجموعة تشغل نطاقاً متصلاً بعد الترتيب، والبحث الثنائي يتم داخل نطاقها فقط
+    boundaries = np.r_[0, np.flatnonzero(group_codes[1:] != group_codes[:-1]) + 1, len(times)]
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        group_times = times[start:end]
+        window_start = np.searchsorted(group_times, group_times - window, side='right')
+        counts[start:end] = np.arange(end - start) - window_start + 1
+    return counts
+
+# دالة لرصد موجات الأحداث (مثل تتابع الأعطال خلال فترة قصيرة)
+def detect_event_bursts(df, window_minutes=10, min_events=20, by='Event', targets=None, machine_col=None):
+    """
+    رصد الفترات التي يتجاوز فيها عدد أحداث نوع معين الحد المسموح خلال نافذة زمنية
+    """
+    columns = ['المجموعة', 'البداية', 'النهاية', 'المدة (دقائق)', 'عدد الأحداث', 'الذروة في النافذة', 'معدل الذروة (حدث/دقيقة)']
+    if df is None or 'DateTime' not in df.columns or by not in df.columns:
+        return pd.DataFrame(columns=columns)
+    
+    machine_col = machine_column(df, machine_col)
+    data = df[['DateTime', by] + ([machine_col] if machine_col else [])].dropna(subset=['DateTime', by])
+    if targets:
+        data = data[data[by].isin(targets)]
+    if data.empty:
+        return pd.DataFrame(columns=columns)
+    
+    # ترتيب الأحداث حسب المجموعة (النوع أو الفئة، والآلة إن وجدت) ثم الوقت
+    keys = data[by].astype(str)
+    if machine_col:
+        keys = data[machine_col].astype(str) + " | " + keys
+    group_codes, group_names = pd.factorize(keys, sort=True)
+    times = data['DateTime'].to_numpy()
+    order = np.lexsort((times, group_codes))
+    times, group_codes = times[order], group_codes[order]
+    
+    counts = rolling_event_counts(times, group_codes, window_minutes)
+    flagged = counts >= min_events
+    if not flagged.any():
+        return pd.DataFrame(columns=columns)
+    
+    # كل سلسلة متصلة من النوافذ المتجاوزة داخل نفس المجموعة تمثل موجة واحدة
+    same_group = np.r_[False, group_codes[1:] == group_codes[:-1]]
+    burst_start = flagged & ~(np.r_[False, flagged[:-1]] & same_group)
+    positions = np.flatnonzero(flagged)
+    boundaries = np.flatnonzero(burst_start[positions])
+    first = positions[boundaries]
+    last = positions[np.r_[boundaries[1:] - 1, len(positions) - 1]]
+    peak = np.maximum.reduceat(counts[positions], boundaries)
+    
+    # بداية الموجة هي أول حدث في النافذة التي تجاوزت الحد أولاً
+    window_first = first - counts[first] + 1
+    starts = pd.to_datetime(times[window_first])
+    ends = pd.to_datetime(times[last])
+    
+    return pd.DataFrame({
+        'المجموعة': group_names[group_codes[first]],
+        'البداية': starts,
+        'النهاية': ends,
+        'المدة (دقائق)': (ends - starts).total_seconds() / 60,
+        'عدد الأحداث': last - window_first + 1,
+        'الذروة في النافذة': peak,
+        'معدل الذروة (حدث/دقيقة)': peak / window_minutes
+    })
+
+# دالة لترتيب الأحداث كتسلسل مكوّد لكل آلة
+def event_sequence(df, machine_col=None):
+    """
+    إرجاع أكواد الآلة والحدث والأوقات مرتبة حسب الآلة ثم الوقت مع أسماء الأكواد
+    """
+    machine_col = machine_column(df, machine_col)
+    
+    # التكويد على القيم الخام ثم توحيد الأسماء المميزة فقط (بدون تنظيف كل صف)
+    raw_codes, raw_names = pd.factorize(df['Event'])
+    name_codes, event_names = pd.factorize(pd.Index(raw_names).astype(str).str.strip())
+    valid = (raw_codes >= 0) & df['DateTime'].notna().to_numpy()
+    event_codes = name_codes[raw_codes[valid]]
+    times = df['DateTime'].to_numpy()[valid]
+    if machine_col:
+        raw_codes, raw_names = pd.factorize(df[machine_col], use_na_sentinel=False)
+        name_codes, machine_names = pd.factorize(pd.Index(raw_names).astype(str), sort=True)
+        machine_codes = name_codes[raw_codes[valid]]
+    else:
+        machine_codes, machine_names = np.zeros(len(times), dtype=np.int64), pd.Index(["الكل"])
+    
+    # البيانات غالباً مرتبة زمنياً مسبقاً فيكفي ترتيب مستقر حسب الآلة
+    if (times[1:] >= times[:-1]).all():
+        order = np.argsort(machine_codes, kind='stable')
+    else:
+        order = np.lexsort((times, machine_codes))
+    return machine_codes[order], event_codes[order], times[order], machine_names, event_names
+
+# دالة لحساب مصفوفة الانتقال بين الأحداث
+def event_transitions(df, machine_col=None):
+    """
+    حساب عدد مرات انتقال كل حدث إلى الحدث التالي على نفس الآلة ووسيط الفاصل الزمني بينهما
+    """
+    columns = ['الآلة', 'الحدث', 'الحدث التالي', 'التكرار', 'الاحتمال %', 'وسيط الفاصل (ثواني)']
+    if df is None or 'DateTime' not in df.columns or 'Event' not in df.columns:
+        return pd.DataFrame(columns=columns)
+    
+    machines, events, times, machine_names, event_names = event_sequence(df, machine_col)
+    # كل حدث يُقارن بالحدث الذي يليه مباشرة على نفس الآلة (إزاحة بمقدار واحد)
+    same_machine = machines[1:] == machines[:-1]
+    if not same_machine.any():
+        return pd.DataFrame(columns=columns)
+    
+    pairs = pd.DataFrame({
+        'machine': machines[:-1][same_machine],
+        'event': events[:-1][same_machine],
+        'next_event': events[1:][same_machine],
+        'gap': (times[1:] - times[:-1])[same_machine] / np.timedelta64(1, 's')
+    })
+    transitions = pairs.groupby(['machine', 'event', 'next_event'], sort=False)['gap'].agg(['size', 'median']).reset_index()
+    outgoing = transitions.groupby(['machine', 'event'])['size'].transform('sum')
+    transitions = transitions.sort_values(['machine', 'size'], ascending=[True, False], kind='stable')
+    
+    return pd.DataFrame({
+        'الآلة': machine_names[transitions['machine'].to_numpy()],
+        'الحدث': event_names[transitions['event'].to_numpy()],
+        'الحدث التالي': event_names[transitions['next_event'].to_numpy()],
+        'التكرار': transitions['size'].to_numpy(),
+        'الاحتمال %': (transitions['size'] / outgoing.loc[transitions.index] * 100).to_numpy(),
+        'وسيط الفاصل (ثواني)': transitions['median'].to_numpy()
+    })
+
+# دالة لاستخراج تسلسلات الأحداث التي تسبق أحداث التوقف
+def sequences_before_events(df, targets, length=3, max_span_minutes=None, top_n=20, machine_col=None):
+    """
+    أكثر تسلسلات الأحداث (n-gram) تكراراً قبل كل حدث مستهدف على نفس الآلة
+    """
+    columns = ['الحدث المستهدف', 'التسلسل السابق', 'التكرار', 'النسبة %', 'وسيط المدة حتى الحدث (ثواني)']
+    if df is None or 'DateTime' not in df.columns or 'Event' not in df.columns or not targets:
+        return pd.DataFrame(columns=columns)
+    
+    machines, events, times, machine_names, event_names = event_sequence(df, machine_col)
+    target_codes = np.flatnonzero(event_names.isin([str(t).strip() for t in targets]))
+    positions = np.flatnonzero(np.isin(events, target_codes))
+    positions = positions[positions >= length]
+    if len(positions) == 0:
+        return pd.DataFrame(columns=columns)
+    
+    # مصفوفة مواقع الأحداث السابقة: كل صف يحتوي على الأحداث من p-length إلى p-1
+    window = positions[:, None] - np.arange(length, 0, -1)
+    # استبعاد التسلسلات التي تعبر إلى آلة أخرى أو تتجاوز المدة المسموحة
+    valid = machines[window[:, 0]] == machines[positions]
+    span = (times[positions] - times[window[:, 0]]) / np.timedelta64(1, 's')
+    if max_span_minutes:
+        valid &= span <= max_span_minutes * 60
+    if not valid.any():
+        return pd.DataFrame(columns=columns)
+    
+    grams = pd.DataFrame(events[window[valid]], columns=[f"e{i}" for i in range(length)])
+    grams['target'] = events[positions[valid]]
+    grams['span'] = span[valid]
+    counts = grams.groupby(['target'] + [f"e{i}" for i in range(length)], sort=False)['span'].agg(['size', 'median']).reset_index()
+    totals = counts.groupby('target')['size'].transform('sum')
+    counts['share'] = counts['size'] / totals * 100
+    counts = counts.sort_values(['target', 'size'], ascending=[True, False], kind='stable').groupby('target').head(top_n)
+    
+    steps = [event_names[counts[f"e{i}"].to_numpy()] for i in range(length)]
+    return pd.DataFrame({
+        'الحدث المستهدف': event_names[counts['target'].to_numpy()],
+        'التسلسل السابق': [" → ".join(sequence) for sequence in zip(*steps)],
+        'التكرار': counts['size'].to_numpy(),
+        'النسبة %': counts['share'].to_numpy(),
+        'وسيط المدة حتى الحدث (ثواني)': counts['median'].to_numpy()
+    })
+
+# دالة لتحويل DataFrame إلى Excel وتنزيله
+def convert_to_excel_download(df, filename="organized_data.xlsx"):
+    """
+    تحويل DataFrame إلى ملف Excel وتوفيره للتنزيل
+    """
+    try:
+        output = BytesIO()
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False, sheet_name='Data')
+        excel_data = output.getvalue()
+        
+        b64 = base64.b64encode(excel_data).decode()
+        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="{filename}">📥 انقر للتحميل</a>'
+        return href
+    except Exception as e:
+        st.error(f"❌ خطأ في تحويل الملف: {e}")
+        return None
+
+# دالة لتحويل DataFrame إلى صيغة عمودية أو CSV مضغوط
+def convert_to_columnar_bytes(df, export_format="parquet"):
+    """
+    تحويل DataFrame إلى Parquet أو Arrow IPC أو CSV مضغوط مع الحفاظ على أنواع الأعمدة
+    """
+    output = BytesIO()
+    df_out = df.reset_index(drop=True)
+    
+    # ترميز الأحداث كفئات (قاموس) لتقليل الحجم وسرعة إعادة التحميل
+    for column in ('Event', 'Category'):
+        if column in df_out.columns and not isinstance(df_out[column].dtype, pd.CategoricalDtype):
+            df_out[column] = df_out[column].astype('category')
+    
+    if export_format == "parquet":
+        df_out.to_parquet(output, index=False)
+    elif export_format == "arrow":
+        df_out.to_feather(output)
+    else:
+        # التاريخ بتنسيق ISO ثابت مع أجزاء الثانية ليُقرأ مباشرة عند إعادة التحميل دون فقدان الدقة
+        df_out.to_csv(
+            output,
+            index=False,
+            date_format='%Y-%m-%dT%H:%M:%S.%f',
+            compression={'method': 'gzip', 'compresslevel': 1}
+        )
+    
+    return output.getvalue()
+
+# دالة لتوليد مفتاح يميز مجموعة البيانات الحالية (يُستخدم لتخزين نتائج الحسابات مؤقتاً)
+def dataset_key(uploaded_file, use_sample, txt_params, remote_files=None):
+    """
+    إنشاء مفتاح ثابت من الملف المرفوع (أو بصمات الملفات البعيدة) وإعدادات المعالجة
+    """
+    parts = [str(use_sample), json.dumps(txt_params, sort_keys=True)]
+    if uploaded_file is not None:
+        parts += [uploaded_file.name, str(getattr(uploaded_file, 'file_id', '')), str(getattr(uploaded_file, 'size', ''))]
+    if remote_files:
+        parts += [f"{entry['name']}:{entry['sha256']}" for entry in remote_files]
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+# دالة لتوليد مفتاح البيانات بعد التصنيف (مفتاح التحميل مع قواعد التصنيف)
+def classified_key(data_key, event_rules):
+    """
+    مفتاح للحسابات التي تعتمد على الفئات؛ الحسابات المعتمدة على الأحداث فقط تستخدم مفتاح التحميل
+    """
+    rules_hash = hashlib.sha1(json.dumps(event_rules, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"{data_key}|{rules_hash}"
+
+# دالة لتحميل ملف واحد من النسخة المحلية
+# الملفات الخام تُحفظ لفترة قصيرة لتسريع المزامنة المتكررة فقط؛ النتيجة المضغوطة النهائية تحفظها start_ingest
+@st.cache_data(show_spinner=False, max_entries=32, ttl=600)
+def load_mirrored_file(path, name, txt_params=None):
+    """
+    قراءة ملف من النسخة المحلية؛ المسار مبني على بصمة المحتوى فلا يُعاد تحليل إلا الملفات التي تغيرت
+    """
+    with open(path, 'rb') as f:
+        file_obj = BytesIO(f.read())
+    file_obj.name = name
+    messages = []
+    return read_data_file(file_obj, txt_params, messages), messages
+
+# دالة لتحميل ملفات النسخة المحلية للمستودع البعيد
+def load_mirrored_files(remote_files, txt_params=None, messages=None):
+    """
+    قراءة الملفات المتزامنة ودمجها في DataFrame واحد مع عمود اسم الملف المصدر
+    """
+    messages = [] if messages is None else messages
+    frames = []
+    for entry in remote_files:
+        df_file, file_messages = load_mirrored_file(entry['path'], entry['name'], txt_params if entry['name'].endswith('.txt') else None)
+        messages.extend(file_messages)
+        if df_file is not None and len(df_file) > 0:
+            frames.append(df_file.assign(SourceFile=entry['name']))
+    
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    df['SourceFile'] = df['SourceFile'].astype('category')
+    return df
+
+# دالة لتحميل وتحضير البيانات
+def load_prepared_data(uploaded_file, use_sample, txt_params, remote_files=None):
+    """
+    تحميل البيانات وتحضيرها وتقليص أنواع أعمدتها (تُنفذ في الخلفية)
+    
+    تُرجع البيانات وتقرير الذاكرة ورسائل الحالة (area, level, text) لتعرضها الصفحة بعد الانتهاء،
+    لأن الخيط الخلفي لا يملك سياق تشغيل Streamlit ولا تظهر أي عناصر يكتبها.
+    """
+    messages = []
+    if remote_files:
+        df_raw = load_mirrored_files(remote_files, txt_params, messages)
+    else:
+        df_raw, load_messages = load_data(uploaded_file, use_sample, txt_params)
+        messages.extend(load_messages)
+    if df_raw is None:
+        return None, None, messages
+    df = prepare_data(df_raw, messages)
+    if df is None:
+        return None, None, messages
+    df, memory_report = compact_dataframe(df)
+    return df, memory_report, messages
+
+# دالة لتطبيق مرشحات استعلامات الواجهة المحلية
+def apply_query_filters(df, params):
+    """
+    تصفية البيانات حسب start و end (بحث ثنائي لأن البيانات في السجل مرتبة حسب الوقت) و events و categories
+    """
+    if 'DateTime' in df.columns and (params.get('start') or params.get('end')):
+        times = df['DateTime']
+        lower = times.searchsorted(pd.Timestamp(params['start']), side='left') if params.get('start') else 0
+        upper = times.searchsorted(pd.Timestamp(params['end']), side='right') if params.get('end') else len(df)
+        df = df.iloc[lower:upper]
+    if params.get('events') and 'Event' in df.columns:
+        df = df[df['Event'].isin(params['events'])]
+    if params.get('categories') and 'Category' in df.columns:
+        df = df[df['Category'].isin(params['categories'])]
+    return df
+
+# دوال استعلامات الواجهة المحلية: كل دالة تستقبل البيانات والمعاملات وتعيد نتيجة قابلة للتحويل إلى JSON
+def query_event_counts(df, params):
+    """
+    عدد مرات تكرار كل حدث (أو كل فئة عند by = Category)
+    """
+    df = apply_query_filters(df, params)
+    column = params.get('by', 'Event')
+    counts = df[column].value_counts()
+    counts = counts[counts > 0]
+    if params.get('limit'):
+        counts = counts.head(int(params['limit']))
+    return {'total': len(df), 'counts': [{'value': value, 'count': count} for value, count in counts.items()]}
+
+def query_rows(df, params):
+    """
+    الصفوف المصفاة مع دعم الأعمدة والإزاحة والحد الأقصى
+    """
+    df = apply_query_filters(df, params)
+    limit = min(int(params.get('limit', 100)), 10000)
+    offset = int(params.get('offset', 0))
+    columns = [c for c in params.get('columns', df.columns) if c in df.columns]
+    return {'total': len(df), 'rows': df[columns].iloc[offset:offset + limit].to_dict(orient='records')}
+
+def query_downtime(df, params):
+    """
+    مدة التوقف لحدث واحد بنفس منطق calculate_downtime
+    """
+    df = apply_query_filters(df, {k: v for k, v in params.items() if k in ('start', 'end')})
+    total_minutes, event_count, periods = calculate_downtime(df, params['event'], params.get('reference', "Automatic mode"))
+    result = {'total_minutes': total_minutes, 'event_count': event_count, 'periods_count': len(periods)}
+    if params.get('include_periods'):
+        result['periods'] = periods
+    return result
+
+def query_group_downtime(df, params):
+    """
+    مدة التوقف لمجموعة أحداث (events) أو فئات (categories) بنفس منطق calculate_group_downtime
+    """
+    df = apply_query_filters(df, {k: v for k, v in params.items() if k in ('start', 'end')})
+    by_category = bool(params.get('categories'))
+    event_list = params['categories'] if by_category else params.get('events', [])
+    total_minutes, event_count, periods = calculate_group_downtime(df, event_list, params.get('reference', "Automatic mode"), by_category=by_category)
+    result = {'total_minutes': total_minutes, 'event_count': event_count, 'periods_count': len(periods)}
+    if params.get('include_periods'):
+        result['periods'] = periods
+    return result
+
+def query_reliability(df, params):
+    """
+    مؤشرات الاعتمادية لمجموعة أحداث أو فئات التوقف
+    """
+    df = apply_query_filters(df, {k: v for k, v in params.items() if k in ('start', 'end')})
+    by_category = bool(params.get('categories'))
+    event_list = params['categories'] if by_category else params.get('events', [])
+    return calculate_reliability(df, event_list, params.get('reference', "Automatic mode"), by_category=by_category)
+
+QUERY_HANDLERS = {
+    'event_counts': query_event_counts,
+    'rows': query_rows,
+    'downtime': query_downtime,
+    'group_downtime': query_group_downtime,
+    'reliability': query_reliability,
+}
+
+# سجل البيانات المشترك لواجهة الاستعلام المحلية
+@st.cache_resource
+def query_registry():
+    """
+    إنشاء سجل البيانات الجاهزة في الذاكرة (مشترك بين كل الجلسات)
+    """
+    return DatasetRegistry()
+
+# خادم واجهة الاستعلام المحلية
+@st.cache_resource
+def query_server(port):
+    """
+    تشغيل خادم الاستعلام مرة واحدة لكل منفذ
+    """
+    return start_query_server(query_registry(), QUERY_HANDLERS, port=port)
+
+# منفذ خلفي مشترك لتحميل الملفات
+@st.cache_resource
+def ingest_executor():
+    """
+    إنشاء منفذ خيوط خلفي لتحميل وتحضير الملفات الكبيرة
+    """
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest")
+
+# دالة لإنشاء منفذ خلفي مستقل للإحصائيات الدقيقة
+@st.cache_resource
+def statistics_executor():
+    """
+    منفذ خيط واحد للإحصائيات حتى لا يؤخر حسابها الطويل تحميل الملفات
+    """
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="statistics")
+
+# دالة لبدء تحميل البيانات في الخلفية مرة واحدة لكل مجموعة بيانات
+# (المهمة الملغاة قبل بدئها لا تُعاد من الذاكرة المؤقتة بل تُنشأ مهمة جديدة)
+@st.cache_resource(max_entries=4, validate=lambda ingest: not ingest.cancelled())
+def start_ingest(_uploaded_file, data_key, use_sample, txt_params, _remote_files=None):
+    """
+    بدء التحميل والتحضير في الخلفية والاحتفاظ بالنتيجة في الذاكرة بدون نسخها في كل إعادة تشغيل
+    """
+    return ingest_executor().submit(load_prepared_data, _uploaded_file, use_sample, txt_params, _remote_files)
+
+# دالة لتصنيف البيانات المحملة حسب قواعد التصنيف الحالية
+@st.cache_resource(show_spinner=False, max_entries=4)
+def classify_dataset(_df, data_key, _event_rules):
+    """
+    إضافة عمود الفئة Category على نسخة سطحية تشارك باقي الأعمدة مع البيانات المحملة
+    
+    تعديل القواعد يعيد التصنيف فقط (مرة واحدة لكل حدث مميز) بدون إعادة التحميل والتحضير.
+    """
+    df = _df.copy(deep=False)
+    if 'Event' in df.columns:
+        df['Category'] = classify_events(df['Event'], _event_rules)
+    return df
+
+# دالة لتصفية البيانات حسب التاريخ والأحداث
+# (نسخ قليلة ولمدة محدودة لأن كل نسخة مصفاة قد تقارب حجم البيانات الكاملة)
+@st.cache_resource(show_spinner=False, max_entries=2, ttl=600)
+def filter_dataset(_df, data_key, start_date=None, end_date=None, selected_events=()):
+    """
+    تطبيق التصفية التاريخية وتصفية الأحداث مع حفظ النتيجة لآخر مجموعات إعدادات
+    
+    إذا لم تستبعد التصفية أي صف تُرجع البيانات الأصلية نفسها بدون نسخ.
+    """
+    mask = np.ones(len(_df), dtype=bool)
+    if start_date is not None and end_date is not None and 'DateTime' in _df.columns:
+        # المقارنة مع حدود زمنية أسرع من تحويل كل قيمة إلى تاريخ
+        times = _df['DateTime']
+        mask &= ((times >= pd.Timestamp(start_date)) & (times < pd.Timestamp(end_date) + pd.Timedelta(days=1))).to_numpy()
+    if selected_events and 'Event' in _df.columns:
+        mask &= _df['Event'].isin(selected_events).to_numpy()
+    if mask.all():
+        return _df
+    return _df[mask]
+
+# دالة لاستخراج قائمة الأحداث المميزة
+@st.cache_data(show_spinner=False, max_entries=16)
+def unique_events(_df, data_key):
+    """
+    إرجاع الأحداث المميزة بترتيب ظهورها
+    """
+    return _df['Event'].dropna().unique().tolist()
+
+# دالة لاستخراج قائمة الأحداث المرتبة
+@st.cache_data(show_spinner=False, max_entries=16)
+def sorted_events(_df, data_key):
+    """
+    إرجاع الأحداث المميزة مرتبة أبجدياً
+    """
+    return sorted(_df['Event'].dropna().astype(str).unique().tolist())
+
+# دالة لترتيب البيانات للعرض
+@st.cache_resource(show_spinner=False, max_entries=16)
+def sort_for_display(_df, data_key, sort_column, ascending, rows):
+    """
+    ترتيب البيانات وإرجاع الصفوف المطلوبة للعرض فقط
+    """
+    return _df.sort_values(by=sort_column, ascending=ascending).head(rows)
+
+# دالة لحساب الإحصائيات الدقيقة (بدون ذاكرة مؤقتة لتعمل في الخلفية)
+def event_statistics(df):
+    """
+    حساب عدد السجلات والمدة الزمنية وعدد أنواع الأحداث وتوزيعها
+    """
+    stats = {'total': len(df), 'days': None, 'unique_events': None, 'event_stats': None, 'approximate': False}
+    if 'DateTime' in df.columns:
+        try:
+            stats['days'] = (df['DateTime'].max() - df['DateTime'].min()).days
+        except Exception:
+            stats['days'] = None
+    if 'Event' in df.columns:
+        event_counts = df['Event'].value_counts()
+        # الأعمدة من نوع الفئات تُرجع كل الفئات حتى غير الموجودة بعد التصفية
+        event_stats = event_counts[event_counts > 0].reset_index()
+        event_stats.columns = ['الحدث', 'التكرار']
+        stats['unique_events'] = len(event_stats)
+        stats['event_stats'] = event_stats
+    return stats
+
+# دالة لتقدير الإحصائيات من عينة عشوائية
+def approximate_statistics(df, sample_size=APPROX_SAMPLE_SIZE, seed=0):
+    """
+    تقدير توزيع الأحداث من عينة عشوائية مع هامش خطأ 95% لكل تكرار
+    
+    عدد السجلات والمدة الزمنية دقيقان لأنهما لا يحتاجان إلى مرور مكلف على النصوص.
+    عدد أنواع الأحداث من العينة حد أدنى، والأحداث النادرة قد لا تظهر فيها.
+    """
+    total = len(df)
+    stats = {'total': total, 'days': None, 'unique_events': None, 'event_stats': None, 'approximate': True, 'sample_size': min(sample_size, total)}
+    if 'DateTime' in df.columns:
+        try:
+            times = df['DateTime'].to_numpy()
+            stats['days'] = int((times.max() - times.min()) // np.timedelta64(1, 'D'))
+        except Exception:
+            stats['days'] = None
+    if 'Event' in df.columns and total > 0:
+        n = stats['sample_size']
+        positions = np.sort(np.random.default_rng(seed).choice(total, size=n, replace=False))
+        counts = df['Event'].iloc[positions].value_counts()
+        counts = counts[counts > 0]
+        share = (counts / n).to_numpy()
+        # الخطأ المعياري للنسبة مع تصحيح المجتمع المحدود
+        correction = (total - n) / (total - 1) if total > 1 else 0.0
+        margin = 1.96 * total * np.sqrt(share * (1 - share) / n * correction)
+        event_stats = pd.DataFrame({
+            'الحدث': counts.index,
+            'التكرار': np.round(share * total).astype(np.int64),
+            'هامش الخطأ (±)': np.ceil(margin).astype(np.int64)
+        })
+        stats['unique_events'] = len(event_stats)
+        stats['event_stats'] = event_stats
+    return stats
+
+# دالة لحساب إحصائيات تبويب الإحصائيات
+@st.cache_data(show_spinner=False, max_entries=16)
+def compute_statistics(_df, data_key):
+    """
+    حساب إحصائيات تبويب الإحصائيات مع حفظ النتيجة
+    """
+    return event_statistics(_df)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_approximate_statistics(_df, data_key):
+    """
+    تقدير إحصائيات تبويب الإحصائيات من عينة مع حفظ النتيجة
+    """
+    return approximate_statistics(_df)
+
+# دالة لتحديد إن كان حساب الإحصائيات الدقيقة مكلفاً بما يكفي لعرض تقديرات أولاً
+def statistics_are_costly(df):
+    """
+    الإحصائيات الدقيقة مكلفة للبيانات الكبيرة فقط إذا كان عمود الأحداث نصياً؛ العمود الفئوي يُعد من رموزه مباشرة
+    """
+    if len(df) < APPROX_STATS_MIN_ROWS or 'Event' not in df.columns:
+        return False
+    return not isinstance(df['Event'].dtype, pd.CategoricalDtype)
+
+# دالة لبدء حساب الإحصائيات الدقيقة في الخلفية مرة واحدة لكل مجموعة بيانات
+@st.cache_resource(show_spinner=False, max_entries=16)
+def start_statistics(_df, data_key):
+    """
+    بدء حساب الإحصائيات الدقيقة في الخلفية وإرجاع كائن المهمة
+    """
+    return statistics_executor().submit(event_statistics, _df)
+
+# دالة للبحث في عمود التفاصيل
+@st.cache_data(show_spinner=False, max_entries=32)
+def search_details(_df, data_key, search_term, limit=20):
+    """
+    البحث في التفاصيل وإرجاع عدد النتائج وأول النتائج للعرض
+    """
+    matches = _df['Details'].str.contains(search_term, case=False, na=False)
+    return int(matches.sum()), _df[matches].head(limit)
+
+# دوال لحفظ نتائج حساب التوقف لكل مجموعة بيانات وإعدادات
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_downtime(_df, data_key, event_name, reference_event):
+    """
+    حساب مدة التوقف لحدث معين مع حفظ النتيجة
+    """
+    return calculate_downtime(_df, event_name, reference_event)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_group_downtime(_df, data_key, event_list, reference_event, by_category=False):
+    """
+    حساب مدة التوقف لمجموعة أحداث مع حفظ النتيجة
+    """
+    return calculate_group_downtime(_df, event_list, reference_event, by_category=by_category)
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def cached_state_intervals(_df, data_key, machine_col=None):
+    """
+    بناء فترات الحالة للخط الزمني مع حفظ النتيجة
+    """
+    return build_state_intervals(_df, machine_col)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_bursts(_df, data_key, window_minutes, min_events, by, targets, machine_col=None):
+    """
+    رصد موجات الأحداث مع حفظ النتيجة
+    """
+    return detect_event_bursts(_df, window_minutes, min_events, by, list(targets), machine_col)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_transitions(_df, data_key, machine_col=None):
+    """
+    حساب مصفوفة الانتقال بين الأحداث مع حفظ النتيجة
+    """
+    return event_transitions(_df, machine_col)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_sequences(_df, data_key, targets, length, max_span_minutes, top_n, machine_col=None):
+    """
+    استخراج التسلسلات السابقة للأحداث المستهدفة مع حفظ النتيجة
+    """
+    return sequences_before_events(_df, list(targets), length, max_span_minutes, top_n, machine_col)
+
+# دالة لعرض جدول البيانات (تُعاد وحدها عند تغيير إعدادات العرض أو الترتيب)
+@st.fragment
+def render_data_table(df, df_filtered, filtered_key):
+    """
+    عرض إعدادات العرض وجدول البيانات المرتبة وملخص البيانات
+    """
+    # إعدادات عرض البيانات
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        rows_to_show = st.slider("عدد الصفوف للعرض:", 10, 1000, 100, 10)
+    
+    with col2:
+        # الحصول على أسماء الأعمدة المتاحة
+        available_columns = df.columns.tolist()
+        sort_column = st.selectbox("ترتيب البيانات حسب:", available_columns)
+    
+    with col3:
+        sort_order = st.radio("نوع الترتيب:", ["تصاعدي", "تنازلي"], horizontal=True)
+    
+    # ترتيب البيانات
+    ascending_order = True if sort_order == "تصاعدي" else False
+    try:
+        df_display = sort_for_display(df_filtered, filtered_key, sort_column, ascending_order, rows_to_show)
+    except:
+        df_display = df_filtered.head(rows_to_show)
+        st.warning(f"⚠️ تعذر الترتيب حسب العمود '{sort_column}'")
+    
+    # عرض البيانات
+    st.markdown(f"### 📄 عرض البيانات ({len(df_display)} من {len(df_filtered)} سجل)")
+    
+    # تكوين أعمدة العرض
+    column_config = {}
+    if 'DateTime' in df_display.columns:
+        column_config["DateTime"] = st.column_config.DatetimeColumn("التاريخ والوقت")
+    if 'Date' in df_display.columns:
+        column_config["Date"] = st.column_config.TextColumn("التاريخ")
+    if 'Time' in df_display.columns:
+        column_config["Time"] = st.column_config.TextColumn("الوقت")
+    if 'Event' in df_display.columns:
+        column_config["Event"] = st.column_config.TextColumn("الحدث")
+    if 'Category' in df_display.columns:
+        column_config["Category"] = st.column_config.TextColumn("الفئة")
+    if 'Details' in df_display.columns:
+        column_config["Details"] = st.column_config.TextColumn("التفاصيل", width="large")
+    
+    # عرض البيانات
+    st.dataframe(
+        df_display,
+        use_container_width=True,
+        height=600,
+        column_config=column_config if column_config else None
+    )
+    
+    # عرض ملخص سريع
+    st.markdown(f"""
+    <div class="metric-card">
+        <h4>📊 ملخص البيانات</h4>
+        <p>• عدد السجلات الكلي: <strong>{len(df):,}</strong></p>
+        <p>• عدد السجلات بعد التصفية: <strong>{len(df_filtered):,}</strong></p>
+        <p>• عدد السجلات المعروضة: <strong>{len(df_display):,}</strong></p>
+    </div>
+    """, unsafe_allow_html=True)
+
+
+# دالة للبحث في التفاصيل (الكتابة في مربع البحث لا تعيد حساب باقي التبويبات)
+@st.fragment
+def render_details_search(df_filtered, filtered_key):
+    """
+    عرض مربع البحث في التفاصيل ونتائجه
+    """
+    st.subheader("🔍 البحث في التفاصيل")
+    search_term = st.text_input("ابحث في التفاصيل:")
+    
+    if search_term:
+        try:
+            match_count, search_results = search_details(df_filtered, filtered_key, search_term)
+            st.write(f"نتائج البحث ({match_count} سجل):")
+            st.dataframe(search_results, use_container_width=True)
+        except:
+            st.warning("⚠️ تعذر البحث في التفاصيل")
+
+
+# دالة لعرض ملخص التوقف المخطط وغير المخطط
+def render_calendar_summary(periods_df):
+    """
+    عرض إجمالي التوقف غير المخطط (داخل وقت العمل) والمخطط (خارج الورديات والاستراحات والعطلات والصيانة)
+    """
+    col_a, col_b, col_c = st.columns(3)
+    
+    with col_a:
+        st.metric("توقف غير مخطط", f"{periods_df['توقف غير مخطط (دقائق)'].sum():.2f} دقيقة")
+    
+    with col_b:
+        st.metric("توقف مخطط / خارج وقت العمل", f"{periods_df['توقف مخطط (دقائق)'].sum():.2f} دقيقة")
+    
+    with col_c:
+        st.metric("منه صيانة مخططة", f"{periods_df['صيانة مخططة (دقائق)'].sum():.2f} دقيقة")
+
+# دالة لعرض قسم توقف حدث واحد
+@st.fragment
+def render_single_downtime(df, data_key, work_calendar=None):
+    """
+    حساب وعرض مدة التوقف لحدث معين داخل جزء مستقل من الصفحة
+    """
+    st.markdown("### حساب مدة التوقف لحدث معين")
+    
+    # اختيار الحدث
+    all_events = sorted_events(df, data_key)
+    
+    if not all_events:
+        st.warning("⚠️ لا توجد أحداث في البيانات.")
+        return
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        selected_event = st.selectbox(
+            "اختر حدث التوقف:",
+            options=all_events,
+            key="single_event_select"
+        )
+    
+    with col2:
+        # البحث عن حدث مرجعي مناسب
+        ref_options = all_events
+        ref_index = 0
+        if 'Automatic mode' in all_events:
+            ref_index = all_events.index('Automatic mode')
+        elif 'Manual mode' in all_events:
+            ref_index = all_events.index('Manual mode')
+        
+        reference_event = st.selectbox(
+            "اختر حدث التشغيل (المرجع):",
+            options=all_events,
+            index=ref_index,
+            key="single_ref_select"
+        )
+    
+    # زر الحساب
+    if st.button("🧮 حساب مدة التوقف", type="primary", key="calculate_single"):
+        with st.spinner("جاري حساب مدة التوقف..."):
+            total_minutes, event_count, periods = cached_downtime(df, data_key, selected_event, reference_event)
+            
+            if event_count > 0:
+                if periods:
+                    # عرض النتائج
+                    st.markdown(f"""
+                    <div class="highlight-box">
+                        <h2>📊 نتائج حساب التوقف</h2>
+                        <h3>إجمالي مدة التوقف: <span style="color: #FFD700">{total_minutes:.2f} دقيقة</span></h3>
+                        <p>عدد مرات التوقف: {event_count} مرة</p>
+                        <p>متوسط مدة التوقف: {total_minutes/event_count:.2f} دقيقة</p>
+                    </div>
+                    """, unsafe_allow_html=True)
+                    
+                    # تحويل المدة إلى ساعات وأيام
+                    hours = total_minutes / 60
+                    days = hours / 24
+                    
+                    # عرض بتنسيق جميل
+                    col_a, col_b, col_c = st.columns(3)
+                    
+                    with col_a:
+                        st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
+                        st.markdown(f"**إجمالي الدقائق**")
+                        st.markdown(f"# {total_minutes:.2f}")
+                        st.markdown('</div>', unsafe_allow_html=True)
+                    
+                    with col_b:
+                        st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
+                        st.markdown(f"**إجمالي الساعات**")
+                        st.markdown(f"# {hours:.2f}")
+                        st.markdown('</div>', unsafe_allow_html=True)
+                    
+                    with col_c:
+                        st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
+                        st.markdown(f"**إجمالي الأيام**")
+                        st.markdown(f"# {days:.2f}")
+                        st.markdown('</div>', unsafe_allow_html=True)
+                    
+                    # عرض تفاصيل فترات التوقف
+                    st.subheader("📋 تفاصيل فترات التوقف")
+                    
+                    if periods:
+                        periods_df = pd.DataFrame(periods)
+                        if work_calendar:
+                            periods_df = split_downtime_by_calendar(periods_df, work_calendar)
+                            render_calendar_summary(periods_df)
+                        st.dataframe(
+                            periods_df,
+                            use_container_width=True,
+                            column_config={
+                                "بداية التوقف": st.column_config.DatetimeColumn("بداية التوقف"),
+                                "نهاية التوقف": st.column_config.DatetimeColumn("نهاية التوقف"),
+                                "المدة (دقائق)": st.column_config.NumberColumn("المدة (دقائق)", format="%.2f"),
+                                "الحدث": st.column_config.TextColumn("الحدث"),
+                                "التفاصيل": st.column_config.TextColumn("التفاصيل", width="large")
+                            }
+                        )
+                        
+                        # ملخص فترات التوقف
+                        st.subheader("📊 ملخص فترات التوقف")
+                        
+                        min_duration = periods_df['المدة (دقائق)'].min()
+                        max_duration = periods_df['المدة (دقائق)'].max()
+                        avg_duration = periods_df['المدة (دقائق)'].mean()
+                        
+                        col_d, col_e, col_f = st.columns(3)
+                        
+                        with col_d:
+                            st.metric("أقل مدة توقف", f"{min_duration:.2f} دقيقة")
+                        
+                        with col_e:
+                            st.metric("أكثر مدة توقف", f"{max_duration:.2f} دقيقة")
+                        
+                        with col_f:
+                            st.metric("المتوسط", f"{avg_duration:.2f} دقيقة")
+                else:
+                    st.warning(f"⚠️ تم العثور على {event_count} حدث من نوع '{selected_event}' ولكن لا يمكن حساب مدة التوقف بسبب عدم وجود أحداث مرجعية بعدها.")
+            else:
+                st.error(f"❌ لم يتم العثور على أي حدث من نوع '{selected_event}' في البيانات.")
+
+
+# دالة لعرض قسم توقف مجموعة أحداث
+@st.fragment
+def render_group_downtime(df, data_key, work_calendar=None):
+    """
+    حساب وعرض مدة التوقف لمجموعة أحداث داخل جزء مستقل من الصفحة
+    """
+    st.markdown("### حساب مدة التوقف لمجموعة أحداث")
+    
+    # اختيار مجموعة الأحداث
+    all_events = sorted_events(df, data_key)
+    
+    # اختيار طريقة التحديد: أحداث محددة أو فئات كاملة حسب قواعد التصنيف
+    group_by_category = False
+    if 'Category' in df.columns:
+        group_mode = st.radio(
+            "تحديد أحداث التوقف حسب:",
+            ["الأحداث", "الفئات"],
+            horizontal=True,
+            key="group_mode_select"
+        )
+        group_by_category = group_mode == "الفئات"
+    
+    col1, col2 = st.columns([3, 1])
+    
+    with col1:
+        if group_by_category:
+            all_categories = sorted(df['Category'].dropna().unique().tolist())
+            selected_events = st.multiselect(
+                "اختر فئات التوقف:",
+                options=all_categories,
+                default=[c for c in ['stop', 'alarm'] if c in all_categories],
+                key="group_categories_select"
+            )
+        else:
+            selected_events = st.multiselect(
+                "اختر مجموعة أحداث التوقف:",
+                options=all_events,
+                default=all_events[:2] if len(all_events) >= 2 else all_events,
+                key="group_events_select"
+            )
+    
+    with col2:
+        # البحث عن حدث مرجعي مناسب
+        ref_options = all_events
+        ref_index = 0
+        if 'Automatic mode' in all_events:
+            ref_index = all_events.index('Automatic mode')
+        elif 'Manual mode' in all_events:
+            ref_index = all_events.index('Manual mode')
+        
+        reference_event = st.selectbox(
+            "اختر حدث التشغيل (المرجع):",
+            options=all_events,
+            index=ref_index,
+            key="group_ref_select"
+        )
+    
+    # زر الحساب للمجموعة
+    if st.button("🧮 حساب مدة توقف المجموعة", type="primary", key="calculate_group"):
+        with st.spinner("جاري حساب مدة توقف المجموعة..."):
+            if selected_events:
+                total_minutes, event_count, periods = cached_group_downtime(df, data_key, selected_events, reference_event, group_by_category)
+                
+                if event_count > 0:
+                    if periods:
+                        # عرض النتائج
+                        events_str = ", ".join(selected_events)
+                        st.markdown(f"""
+                        <div class="highlight-box">
+                            <h2>📊 نتائج حساب توقف المجموعة</h2>
+                            <h3>إجمالي مدة التوقف: <span style="color: #FFD700">{total_minutes:.2f} دقيقة</span></h3>
+                            <p>عدد مرات التوقف: {event_count} مرة</p>
+                            <p>متوسط مدة التوقف: {total_minutes/event_count:.2f} دقيقة</p>
+                            <p>الأحداث المختارة: {events_str}</p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        
+                        # تحويل المدة إلى ساعات وأيام
+                        hours = total_minutes / 60
+                        days = hours / 24
+                        
+                        # عرض بتنسيق جميل
+                        col_a, col_b, col_c = st.columns(3)
+                        
+                        with col_a:
+                            st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
+                            st.markdown(f"**إجمالي الدقائق**")
+                            st.markdown(f"# {total_minutes:.2f}")
+                            st.markdown('</div>', unsafe_allow_html=True)
+                        
+                        with col_b:
+                            st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
+                            st.markdown(f"**إجمالي الساعات**")
+                            st.markdown(f"# {hours:.2f}")
+                            st.markdown('</div>', unsafe_allow_html=True)
+                        
+                        with col_c:
+                            st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
+                            st.markdown(f"**إجمالي الأيام**")
+                            st.markdown(f"# {days:.2f}")
+                            st.markdown('</div>', unsafe_allow_html=True)
+                        
+                        # عرض تفاصيل فترات التوقف
+                        st.subheader("📋 تفاصيل فترات التوقف")
+                        
+                        if periods:
+                            periods_df = pd.DataFrame(periods)
+                            if work_calendar:
+                                periods_df = split_downtime_by_calendar(periods_df, work_calendar)
+                                render_calendar_summary(periods_df)
+                            st.dataframe(
+                                periods_df,
+                                use_container_width=True,
+                                column_config={
+                                    "بداية التوقف": st.column_config.DatetimeColumn("بداية التوقف"),
+                                    "نهاية التوقف": st.column_config.DatetimeColumn("نهاية التوقف"),
+                                    "المدة (دقائق)": st.column_config.NumberColumn("المدة (دقائق)", format="%.2f"),
+                                    "الحدث": st.column_config.TextColumn("الحدث"),
+                                    "التفاصيل": st.column_config.TextColumn("التفاصيل", width="large")
+                                }
+                            )
+                    else:
+                        st.warning(f"⚠️ تم العثور على {event_count} حدث من المجموعة المختارة ولكن لا يمكن حساب مدة التوقف بسبب عدم وجود أحداث مرجعية بعدها.")
+                else:
+                    st.error(f"❌ لم يتم العثور على أي حدث من المجموعة المختارة في البيانات.")
+            else:
+                st.warning("⚠️ يرجى اختيار حدث واحد على الأقل من القائمة.")
+
+
+# دالة لعرض خيارات التصدير
+@st.fragment
+def render_export(df_filtered):
+    """
+    عرض أزرار التصدير والمعاينة داخل جزء مستقل من الصفحة
+    """
+    st.header("📥 خيارات التصدير")
+    
+    st.info("""
+    يمكنك تصدير البيانات المصفاة إلى عدة صيغ مختلفة.
+    اختر الصيغة المناسبة واحفظ البيانات على جهازك.
+    """)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown("### 📄 Excel")
+        st.markdown("صيغة جدول بيانات متقدمة")
+        
+        # زر التصدير إلى Excel
+        if st.button("💾 تصدير إلى Excel", use_container_width=True, key="export_excel_main"):
+            try:
+                download_link = convert_to_excel_download(df_filtered, "data_export.xlsx")
+                if download_link:
+                    st.markdown(download_link, unsafe_allow_html=True)
+                    st.success("✅ تم تجهيز ملف Excel للتحميل")
+            except Exception as e:
+                st.error(f"❌ خطأ في تصدير Excel: {e}")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown("### 📊 CSV")
+        st.markdown("صيغة نصية بسيطة")
+        
+        # زر التصدير إلى CSV
+        if st.button("📊 تصدير إلى CSV", use_container_width=True, key="export_csv_main"):
+            try:
+                csv_data = df_filtered.to_csv(index=False, encoding='utf-8-sig')
+                b64 = base64.b64encode(csv_data.encode('utf-8-sig')).decode()
+                href = f'<a href="data:text/csv;charset=utf-8-sig;base64,{b64}" download="data_export.csv">📥 انقر للتحميل</a>'
+                st.markdown(href, unsafe_allow_html=True)
+                st.success("✅ تم تجهيز ملف CSV للتحميل")
+            except Exception as e:
+                st.error(f"❌ خطأ في تصدير CSV: {e}")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with col3:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown("### 📦 Parquet / Arrow")
+        st.markdown("صيغ سريعة تحافظ على أنواع الأعمدة ويمكن إعادة رفعها مباشرة")
+        
+        columnar_format = st.selectbox(
+            "الصيغة:",
+            list(COLUMNAR_EXPORT_FORMATS.keys()),
+            key="export_columnar_format"
+        )
+        
+        # زر تجهيز الملف ثم زر التنزيل
+        if st.button("📦 تجهيز الملف", use_container_width=True, key="export_columnar_main"):
+            try:
+                extension, mime_type = COLUMNAR_EXPORT_FORMATS[columnar_format]
+                st.download_button(
+                    "📥 انقر للتحميل",
+                    data=convert_to_columnar_bytes(df_filtered, extension),
+                    file_name=f"data_export.{extension}",
+                    mime=mime_type,
+                    use_container_width=True,
+                    key="download_columnar"
+                )
+                st.success(f"✅ تم تجهيز ملف {columnar_format} للتحميل")
+            except Exception as e:
+                st.error(f"❌ خطأ في تصدير {columnar_format}: {e}")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    # إحصائيات التصدير
+    st.markdown("### 📈 ملخص البيانات المصدَّرة")
+    st.write(f"**عدد السجلات:** {len(df_filtered):,}")
+    st.write(f"**عدد الأعمدة:** {len(df_filtered.columns)}")
+    
+    # عرض أسماء الأعمدة
+    if len(df_filtered.columns) > 0:
+        st.write(f"**الأعمدة:** {', '.join(df_filtered.columns.tolist())}")
+    
+    # معاينة البيانات قبل التصدير
+    with st.expander("👁️ معاينة البيانات قبل التصدير"):
+        if len(df_filtered) > 0:
+            st.dataframe(df_filtered.head(10), use_container_width=True)
+        else:
+            st.info("لا توجد بيانات للمعاينة")
+
+
+# دالة لعرض الخط الزمني
+@st.fragment
+def render_timeline(df, data_key, machine_col=None):
+    """
+    عرض الخط الزمني للتشغيل والتوقف داخل جزء مستقل من الصفحة
+    """
+    st.header("🕒 الخط الزمني للتشغيل والتوقف")
+    
+    if 'DateTime' not in df.columns or 'Category' not in df.columns:
+        st.warning("⚠️ البيانات لا تحتوي على عمودي 'DateTime' و 'Event' اللازمين للخط الزمني.")
+    else:
+        intervals = cached_state_intervals(df, data_key, machine_col)
+        
+        if intervals.empty:
+            st.info("لا توجد أحداث تشغيل أو توقف لرسم الخط الزمني. راجع قواعد تصنيف الأحداث.")
+        else:
+            timeline_min = df['DateTime'].min().to_pydatetime()
+            timeline_max = df['DateTime'].max().to_pydatetime()
+            
+            col1, col2 = st.columns([3, 1])
+            
+            with col1:
+                # تكبير النطاق الزمني؛ يُعاد التقليص على الخادم لكل نطاق
+                if timeline_max > timeline_min:
+                    visible_range = st.slider(
+                        "النطاق الزمني المعروض:",
+                        min_value=timeline_min,
+                        max_value=timeline_max,
+                        value=(timeline_min, timeline_max),
+                        format="YYYY-MM-DD HH:mm",
+                        key="timeline_range"
+                    )
+                else:
+                    visible_range = (timeline_min, timeline_max + timedelta(minutes=1))
+            
+            with col2:
+                n_buckets = st.slider("دقة العرض (عدد الأعمدة):", 200, 3000, 1000, 100, key="timeline_buckets")
+            
+            bars = downsample_intervals(intervals, visible_range[0], visible_range[1], n_buckets)
+            markers = downsample_markers(df, visible_range[0], visible_range[1], n_buckets, machine_col=machine_col)
+            
+            if bars.empty:
+                st.info("لا توجد فترات في النطاق المحدد")
+            else:
+                st.altair_chart(build_timeline_chart(bars, markers), use_container_width=True)
+                st.caption(f"تم عرض {len(bars) + len(markers):,} عنصر بدلاً من {len(df):,} سجل")
+
+# دالة لعرض رصد موجات الأحداث
+@st.fragment
+def render_bursts(df, data_key, events_key, machine_col=None):
+    """
+    عرض إعدادات رصد موجات الأحداث وقائمة الموجات المكتشفة
+    """
+    st.header("🚨 رصد موجات الأعطال والإنذارات")
+    
+    if 'DateTime' not in df.columns or 'Event' not in df.columns:
+        st.warning("⚠️ البيانات لا تحتوي على عمودي 'DateTime' و 'Event' اللازمين لرصد الموجات.")
+        return
+    
+    col1, col2, col3 = st.columns([2, 1, 1])
+    
+    with col1:
+        # الرصد حسب الفئة (مثل alarm) أو حسب نوع الحدث
+        burst_by = "Event"
+        if 'Category' in df.columns:
+            burst_mode = st.radio("الرصد حسب:", ["الفئات", "الأحداث"], horizontal=True, key="burst_mode")
+            burst_by = "Category" if burst_mode == "الفئات" else "Event"
+        
+        if burst_by == "Category":
+            options = sorted(df['Category'].dropna().astype(str).unique().tolist())
+            default = [c for c in ['alarm'] if c in options]
+        else:
+            options = sorted_events(df, events_key)
+            default = [e for e in options if 'error' in e.lower()]
+        burst_targets = st.multiselect("الأحداث أو الفئات المراقبة (فارغ = الكل):", options, default=default, key=f"burst_targets_{burst_by}")
+    
+    with col2:
+        window_minutes = st.number_input("النافذة الزمنية (دقائق):", min_value=1, value=10, step=1, key="burst_window")
+    
+    with col3:
+        min_events = st.number_input("حد التنبيه (عدد الأحداث):", min_value=2, value=20, step=1, key="burst_threshold")
+    
+    # الرصد حسب الأحداث لا يعتمد على قواعد التصنيف فيُحفظ بمفتاح التحميل
+    burst_key = data_key if burst_by == "Category" else events_key
+    bursts = cached_bursts(df, burst_key, int(window_minutes), int(min_events), burst_by, tuple(burst_targets), machine_col)
+    
+    if bursts.empty:
+        st.success(f"✅ لا توجد موجات تتجاوز {int(min_events)} حدث خلال {int(window_minutes)} دقيقة")
+        return
+    
+    st.markdown(f"""
+    <div class="highlight-box">
+        <h3>تم رصد {len(bursts):,} موجة</h3>
+        <p>أعلى ذروة: {bursts['الذروة في النافذة'].max():,} حدث خلال {int(window_minutes)} دقيقة</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.dataframe(
+        bursts.sort_values('البداية'),
+        use_container_width=True,
+        column_config={
+            "البداية": st.column_config.DatetimeColumn("البداية"),
+            "النهاية": st.column_config.DatetimeColumn("النهاية"),
+            "المدة (دقائق)": st.column_config.NumberColumn("المدة (دقائق)", format="%.2f"),
+            "معدل الذروة (حدث/دقيقة)": st.column_config.NumberColumn("معدل الذروة (حدث/دقيقة)", format="%.2f")
+        }
+    )
+
+# دالة لعرض تحليل تسلسل الأحداث
+@st.fragment
+def render_sequences(df, data_key, machine_col=None):
+    """
+    عرض مصفوفة الانتقال بين الأحداث والتسلسلات التي تسبق أحداث التوقف
+    """
+    st.header("🔗 تحليل تسلسل الأحداث")
+    
+    if 'DateTime' not in df.columns or 'Event' not in df.columns:
+        st.warning("⚠️ البيانات لا تحتوي على عمودي 'DateTime' و 'Event' اللازمين لتحليل التسلسل.")
+        return
+    
+    transitions = cached_transitions(df, data_key, machine_col)
+    if transitions.empty:
+        st.info("لا توجد أحداث متتالية كافية لتحليل التسلسل")
+        return
+    
+    machines = transitions['الآلة'].unique().tolist()
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        machine = st.selectbox("الآلة:", machines, key="sequence_machine") if len(machines) > 1 else machines[0]
+    with col2:
+        matrix_size = st.slider("عدد الأحداث في المصفوفة:", 5, 40, 15, key="sequence_matrix_size")
+    
+    machine_transitions = transitions[transitions['الآلة'] == machine]
+    
+    # مصفوفة الانتقال لأكثر الأحداث تكراراً
+    st.subheader("🔀 مصفوفة الانتقال")
+    top_events = machine_transitions.groupby('الحدث')['التكرار'].sum().nlargest(matrix_size).index
+    matrix = machine_transitions[machine_transitions['الحدث'].isin(top_events) & machine_transitions['الحدث التالي'].isin(top_events)]
+    heatmap = alt.Chart(matrix).mark_rect().encode(
+        x=alt.X('الحدث التالي:N', title='الحدث التالي', sort=list(top_events)),
+        y=alt.Y('الحدث:N', title='الحدث', sort=list(top_events)),
+        color=alt.Color('الاحتمال %:Q', title='الاحتمال %', scale=alt.Scale(scheme='orangered')),
+        tooltip=['الحدث', 'الحدث التالي', 'التكرار', alt.Tooltip('الاحتمال %:Q', format='.1f'), alt.Tooltip('وسيط الفاصل (ثواني):Q', format='.1f')]
+    ).properties(height=max(300, 22 * len(top_events)))
+    st.altair_chart(heatmap, use_container_width=True)
+    
+    # ما يسبق وما يلي حدثاً معيناً
+    st.subheader("🔍 ما قبل وما بعد حدث معين")
+    event_options = machine_transitions.groupby('الحدث')['التكرار'].sum().sort_values(ascending=False).index.tolist()
+    focus_event = st.selectbox("الحدث:", event_options, key="sequence_focus_event")
+    before_col, after_col = st.columns(2)
+    number_format = {
+        "الاحتمال %": st.column_config.NumberColumn("الاحتمال %", format="%.1f"),
+        "وسيط الفاصل (ثواني)": st.column_config.NumberColumn("وسيط الفاصل (ثواني)", format="%.1f")
+    }
+    with before_col:
+        st.markdown("**الأحداث السابقة**")
+        before = machine_transitions[machine_transitions['الحدث التالي'] == focus_event]
+        st.dataframe(before[['الحدث', 'التكرار', 'وسيط الفاصل (ثواني)']].head(20), use_container_width=True, hide_index=True, column_config=number_format)
+    with after_col:
+        st.markdown("**الأحداث التالية**")
+        after = machine_transitions[machine_transitions['الحدث'] == focus_event]
+        st.dataframe(after[['الحدث التالي', 'التكرار', 'الاحتمال %', 'وسيط الفاصل (ثواني)']].head(20), use_container_width=True, hide_index=True, column_config=number_format)
+    
+    # التسلسلات الأكثر تكراراً قبل أحداث التوقف
+    st.subheader("⛓ التسلسلات التي تسبق التوقف")
+    all_events = sorted_events(df, data_key)
+    if 'Category' in df.columns:
+        stop_events = df.loc[df['Category'] == 'stop', 'Event'].dropna().astype(str).str.strip().unique().tolist()
+        default_targets = [e for e in all_events if e in stop_events]
+    else:
+        default_targets = []
+    
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        targets = st.multiselect("الأحداث المستهدفة:", all_events, default=default_targets, key="sequence_targets")
+    with col2:
+        length = st.number_input("طول التسلسل:", min_value=1, max_value=6, value=3, step=1, key="sequence_length")
+    with col3:
+        max_span = st.number_input("أقصى مدة للتسلسل (دقائق، 0 = بدون حد):", min_value=0, value=0, step=5, key="sequence_max_span")
+    
+    sequences = cached_sequences(df, data_key, tuple(targets), int(length), int(max_span) or None, 20, machine_col)
+    if sequences.empty:
+        st.info("لا توجد تسلسلات مطابقة. اختر أحداثاً مستهدفة أو زد المدة المسموحة.")
+        return
+    
+    st.dataframe(
+        sequences,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "النسبة %": st.column_config.NumberColumn("النسبة %", format="%.1f"),
+            "وسيط المدة حتى الحدث (ثواني)": st.column_config.NumberColumn("وسيط المدة حتى الحدث (ثواني)", format="%.1f")
+        }
+    )
+
+# دالة لعرض تقرير استهلاك الذاكرة
+def render_memory_report(memory_report):
+    """
+    عرض حجم كل عمود في الذاكرة قبل وبعد تقليص الأنواع عند التحميل
+    """
+    total_before = memory_report['الذاكرة (MB) قبل'].sum()
+    total_after = memory_report['الذاكرة (MB) بعد'].sum()
+    with st.expander(f"🧮 استهلاك الذاكرة: {total_before:,.2f} MB ← {total_after:,.2f} MB"):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("قبل التقليص (MB)", f"{total_before:,.2f}")
+        col2.metric("بعد التقليص (MB)", f"{total_after:,.2f}")
+        col3.metric("نسبة التوفير", f"{(1 - total_after / total_before) * 100:.0f}%" if total_before else "—")
+        st.dataframe(
+            memory_report,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "الذاكرة (MB) قبل": st.column_config.NumberColumn("الذاكرة قبل (MB)", format="%.2f"),
+                "الذاكرة (MB) بعد": st.column_config.NumberColumn("الذاكرة بعد (MB)", format="%.2f")
+            }
+        )
+        st.caption("الأعمدة بدون قيم بعد التقليص تم حذفها لأن عمود DateTime يحتوي على نفس المعلومة")
+
+# دالة لعرض معاينة الملف أثناء التحميل الكامل في الخلفية
+def render_upload_preview(uploaded_file, txt_params):
+    """
+    عرض الأعمدة المستخرجة وتنسيق التاريخ المكتشف والعدد التقديري للسجلات من أول أسطر الملف
+    """
+    st.info("⏳ جاري تحميل ومعالجة الملف كاملاً في الخلفية... يمكنك مراجعة المعاينة وتعديل إعدادات TXT في الأثناء")
+    
+    try:
+        preview, datetime_format, estimated_rows = preview_file(uploaded_file.getvalue(), uploaded_file.name, txt_params)
+    except Exception as e:
+        st.warning(f"⚠️ تعذر إنشاء معاينة للملف: {e}")
+        return
+    
+    if preview is None:
+        return
+    
+    st.markdown("### 👁️ معاينة سريعة للملف")
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        st.metric("الأعمدة", len(preview.columns))
+    
+    with col2:
+        st.metric("تنسيق التاريخ المكتشف", datetime_format or "غير معروف")
+    
+    with col3:
+        st.metric("العدد التقديري للسجلات", f"~{estimated_rows:,}")
+    
+    st.write(f"**الأعمدة:** {', '.join(map(str, preview.columns))}")
+    st.dataframe(preview.head(100), use_container_width=True, height=300)
+
+# دالة لعرض رسائل التحميل والتحضير
+def show_messages(messages):
+    """
+    عرض رسائل الحالة التي سجلها التحميل في الخلفية، في الشريط الجانبي أو الصفحة الرئيسية
+    """
+    for area, level, text in messages:
+        getattr(st.sidebar if area == 'sidebar' else st, level)(text)
+
+# دالة لمتابعة انتهاء مهمة في الخلفية
+@st.fragment(run_every=1)
+def wait_for_task(task):
+    """
+    إعادة تشغيل التطبيق كاملاً عند انتهاء مهمة في الخلفية (التحميل أو الإحصائيات)
+    """
+    if task.done():
+        st.rerun()
+
+# تحضير معاملات ملف TXT إذا كان موجوداً
+txt_params = None
+if (uploaded_file and uploaded_file.name.endswith('.txt')) or remote_files:
+    txt_params = {
+        'separator': txt_separator,
+        'skip_lines': int(skip_lines),
+        'skip_empty': skip_empty_lines,
+        'skip_comments': skip_comments
+    }
+
+# قراءة قواعد تصنيف الأحداث
+event_rules = parse_event_rules(event_rules_text)
+
+# قراءة تقويم العمل
+work_calendar = parse_work_calendar(work_calendar_text) if use_work_calendar else None
+
+# تحميل وتحضير البيانات في الخلفية (مرة واحدة لكل ملف وإعدادات)
+df, memory_report = None, None
+if uploaded_file is not None or use_sample_data or remote_files:
+    events_key = dataset_key(uploaded_file, use_sample_data, txt_params, remote_files)
+    ingest = start_ingest(uploaded_file, events_key, use_sample_data, txt_params, remote_files)
+    
+    # إلغاء مهمة التحميل السابقة لهذه الجلسة إذا لم تبدأ بعد (مثلاً عند تعديل إعدادات TXT أثناء المعاينة)
+    previous_ingest = st.session_state.get('ingest_job')
+    if previous_ingest is not None and previous_ingest is not ingest:
+        previous_ingest.cancel()
+    st.session_state['ingest_job'] = ingest
+    
+    # الملفات الصغيرة تنتهي خلال الانتظار القصير فلا حاجة للمعاينة
+    wait([ingest], timeout=INGEST_WAIT_SECONDS)
+    
+    # عرض معاينة سريعة حتى ينتهي التحميل الكامل
+    if not ingest.done():
+        if uploaded_file:
+            render_upload_preview(uploaded_file, txt_params)
+        else:
+            st.info("⏳ جاري تحضير البيانات...")
+        wait_for_task(ingest)
+        st.stop()
+    
+    try:
+        df, memory_report, load_messages = ingest.result()
+        show_messages(load_messages)
+        # التصنيف بعد التحميل وبمفتاح مستقل: تعديل القواعد لا يعيد التحميل ولا يلغي الحسابات المعتمدة على الأحداث فقط
+        if df is not None:
+            data_key = classified_key(events_key, event_rules)
+            df = classify_dataset(df, data_key, event_rules)
+    except Exception as e:
+        st.error(f"❌ خطأ في تحميل الملف: {e}")
+        df, memory_report = None, None
+
+if df is not None:
+    # إظهار معلومات الملف المرفوع
+    if uploaded_file:
+        st.markdown(f"""
+        <div class="file-info">
+            <h4>📄 معلومات الملف المرفوع</h4>
+            <p><strong>اسم الملف:</strong> {uploaded_file.name}</p>
+            <p><strong>نوع الملف:</strong> {uploaded_file.type if hasattr(uploaded_file, 'type') else 'غير معروف'}</p>
+            <p><strong>عدد السجلات:</strong> {len(df)}</p>
+            <p><strong>الأعمدة:</strong> {', '.join(df.columns.tolist())}</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # زر لتحويل الملف المعالج إلى Excel
+        if st.button("💾 حفظ البيانات المعالجة كملف Excel", key="save_processed"):
+            download_link = convert_to_excel_download(df, f"processed_{uploaded_file.name.replace('.txt', '.xlsx')}")
+            if download_link:
+                st.markdown(download_link, unsafe_allow_html=True)
+                st.success("✅ تم تجهيز ملف Excel للتحميل")
+    
+    # استهلاك الذاكرة قبل وبعد تقليص أنواع الأعمدة
+    if memory_report is not None:
+        render_memory_report(memory_report)
+
+# الرسالة الرئيسية إذا لم يتم تحميل بيانات
+if df is None or len(df) == 0:
+    st.markdown("""
+    <div class="upload-box">
+        <h3>📁 لم يتم تحميل أي بيانات</h3>
+        <p>يرجى رفع ملف بيانات (TXT أو Excel أو CSV) من الشريط الجانبي</p>
+        <p>أو تفعيل خيار "استخدام بيانات تجريبية"</p>
+        
+        <h4>📝 معلومات عن ملفات TXT:</h4>
+        <p>التطبيق يدعم معالجة ملفات السجلات النصية التي تحتوي على:</p>
+        <ul>
+            <li>أعمدة مفصولة بـ Tab أو فاصلة أو فاصلة منقوطة</li>
+            <li>التنسيق: التاريخ | الوقت | الحدث | التفاصيل</li>
+            <li>يمكن تخطي الأسطر الأولى أو الفارغة</li>
+        </ul>
+    </div>
+    """, unsafe_allow_html=True)
+    st.stop()
+
+# إتاحة البيانات الجاهزة لواجهة الاستعلام المحلية
+if enable_query_api:
+    try:
+        query_server(int(query_api_port))
+        query_registry().put(data_key, df, uploaded_file.name if uploaded_file else "")
+        st.sidebar.caption(f"POST http://127.0.0.1:{int(query_api_port)}/query | GET /datasets")
+    except OSError as e:
+        st.sidebar.error(f"❌ تعذر تشغيل واجهة الاستعلام: {e}")
+
+# قسم العرض الرئيسي: يُعرض ويُحسب القسم المختار فقط (الأقسام غير المفتوحة لا تُنفذ)
+section = st.radio("القسم:", MAIN_SECTIONS, horizontal=True, key="main_section", label_visibility="collapsed")
+
+# عمود الآلة للخط الزمني والموجات والتسلسل؛ يُعرض دائماً حتى يبقى الاختيار عند التنقل بين الأقسام
+machine_options = machine_column_options(df)
+machine_col = None
+if machine_options:
+    default_machine = next((i + 1 for i, c in enumerate(machine_options) if c in MACHINE_COLUMNS), 0)
+    machine_choice = st.selectbox("🏭 عمود الآلة (الخط الزمني، الموجات، التسلسل):", [NO_MACHINE_OPTION] + machine_options, index=default_machine, key="machine_column")
+    machine_col = None if machine_choice == NO_MACHINE_OPTION else machine_choice
+
+# البيانات المصفاة تُستخدم في عرض البيانات والإحصائيات والتصدير؛ كل الحسابات الثقيلة محفوظة مؤقتاً حسب مفتاح التصفية
+df_filtered = df
+filtered_key = data_key
+
+# التصفية تُعرض دائماً خارج الأقسام حتى تبقى قيمها عند التنقل بينها
+with st.expander("🔎 تصفية البيانات (عرض البيانات، الإحصائيات، التصدير)", expanded=True):
+    # تصفية حسب التاريخ إذا كان موجوداً
+    start_date = end_date = None
     if 'DateTime' in df.columns and len(df) > 0:
         st.markdown("### ⏰ تصفية حسب التاريخ")
         date_col1, date_col2 = st.columns(2)
@@ -501,103 +2646,82 @@ with tab1:
         
         # تطبيق التصفية
         try:
-            df_filtered = df[(df['DateTime'].dt.date >= start_date) & 
-                            (df['DateTime'].dt.date <= end_date)].copy()
+            df_filtered = filter_dataset(df, data_key, start_date, end_date)
+            filtered_key = f"{data_key}|{start_date}|{end_date}"
         except:
-            df_filtered = df.copy()
+            df_filtered = df
             st.warning("⚠️ تعذر تطبيق التصفية التاريخية")
     
     # تصفية حسب الحدث
     if 'Event' in df_filtered.columns and len(df_filtered) > 0:
         st.markdown("### 🔍 تصفية حسب الحدث")
-        unique_events = df_filtered['Event'].dropna().unique().tolist()
-        if unique_events:
-            selected_events = st.multiselect("اختر الأحداث:", unique_events)
+        event_options = unique_events(df_filtered, filtered_key)
+        if event_options:
+            selected_events = st.multiselect("اختر الأحداث:", event_options)
             
             if selected_events:
-                df_filtered = df_filtered[df_filtered['Event'].isin(selected_events)]
+                df_filtered = filter_dataset(df, data_key, start_date, end_date, tuple(selected_events))
+                filtered_key = f"{filtered_key}|{'|'.join(map(str, selected_events))}"
         else:
             st.info("لا توجد أحداث للتصفية")
+
+if section == "📋 عرض البيانات":
+    st.header("📋 عرض البيانات التفصيلي")
     
-    # ترتيب البيانات
-    ascending_order = True if sort_order == "تصاعدي" else False
-    try:
-        df_display = df_filtered.sort_values(by=sort_column, ascending=ascending_order).head(rows_to_show)
-    except:
-        df_display = df_filtered.head(rows_to_show)
-        st.warning(f"⚠️ تعذر الترتيب حسب العمود '{sort_column}'")
-    
-    # عرض البيانات
-    st.markdown(f"### 📄 عرض البيانات ({len(df_display)} من {len(df_filtered)} سجل)")
-    
-    # تكوين أعمدة العرض
-    column_config = {}
-    if 'DateTime' in df_display.columns:
-        column_config["DateTime"] = st.column_config.DatetimeColumn("التاريخ والوقت")
-    if 'Date' in df_display.columns:
-        column_config["Date"] = st.column_config.TextColumn("التاريخ")
-    if 'Time' in df_display.columns:
-        column_config["Time"] = st.column_config.TextColumn("الوقت")
-    if 'Event' in df_display.columns:
-        column_config["Event"] = st.column_config.TextColumn("الحدث")
-    if 'Details' in df_display.columns:
-        column_config["Details"] = st.column_config.TextColumn("التفاصيل", width="large")
-    
-    # عرض البيانات
-    st.dataframe(
-        df_display,
-        use_container_width=True,
-        height=600,
-        column_config=column_config if column_config else None
-    )
-    
-    # عرض ملخص سريع
-    st.markdown(f"""
-    <div class="metric-card">
-        <h4>📊 ملخص البيانات</h4>
-        <p>• عدد السجلات الكلي: <strong>{len(df):,}</strong></p>
-        <p>• عدد السجلات بعد التصفية: <strong>{len(df_filtered):,}</strong></p>
-        <p>• عدد السجلات المعروضة: <strong>{len(df_display):,}</strong></p>
-    </div>
-    """, unsafe_allow_html=True)
+    # الترتيب والعرض في جزء مستقل لا يعيد تشغيل باقي الصفحة
+    render_data_table(df, df_filtered, filtered_key)
 
-with tab2:
+elif section == "📊 الإحصائيات":
     st.header("📊 الإحصائيات التحليلية")
     
     if len(df_filtered) > 0:
+        # البيانات الكبيرة جداً: عرض تقديرات من عينة فوراً ثم التحديث عند اكتمال الحساب الدقيق
+        if statistics_are_costly(df_filtered):
+            statistics_task = start_statistics(df_filtered, filtered_key)
+            if statistics_task.done():
+                try:
+                    stats = statistics_task.result()
+                except Exception as e:
+                    stats = cached_approximate_statistics(df_filtered, filtered_key)
+                    st.warning(f"⚠️ تعذر حساب الإحصائيات الدقيقة، تُعرض قيم تقديرية من عينة من {stats['sample_size']:,} سجل: {e}")
+            else:
+                stats = cached_approximate_statistics(df_filtered, filtered_key)
+                st.info(f"⏳ قيم تقديرية من عينة عشوائية من {stats['sample_size']:,} سجل (هامش خطأ 95%)؛ سيتم التحديث تلقائياً عند اكتمال الحساب الدقيق")
+                wait_for_task(statistics_task)
+        else:
+            stats = compute_statistics(df_filtered, filtered_key)
+        approx_prefix = "≈ " if stats['approximate'] else ""
+        
         # مؤشرات سريعة
         st.subheader("📈 مؤشرات سريعة")
         col1, col2, col3 = st.columns(3)
         
         with col1:
             st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.metric("إجمالي السجلات", f"{len(df_filtered):,}")
+            st.metric("إجمالي السجلات", f"{stats['total']:,}")
             st.markdown('</div>', unsafe_allow_html=True)
         
         with col2:
             if 'DateTime' in df_filtered.columns:
-                try:
-                    date_range = (df_filtered['DateTime'].max() - df_filtered['DateTime'].min()).days
+                if stats['days'] is not None:
                     st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                    st.metric("المدة الزمنية (أيام)", f"{date_range:,}")
+                    st.metric("المدة الزمنية (أيام)", f"{stats['days']:,}")
                     st.markdown('</div>', unsafe_allow_html=True)
-                except:
+                else:
                     st.markdown('<div class="metric-card">', unsafe_allow_html=True)
                     st.metric("المدة الزمنية", "غير متاح")
                     st.markdown('</div>', unsafe_allow_html=True)
         
         with col3:
-            if 'Event' in df_filtered.columns:
-                unique_events = df_filtered['Event'].nunique()
+            if stats['unique_events'] is not None:
                 st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-                st.metric("عدد أنواع الأحداث", f"{unique_events:,}")
+                st.metric("عدد أنواع الأحداث", f"{'≥ ' if stats['approximate'] else ''}{stats['unique_events']:,}")
                 st.markdown('</div>', unsafe_allow_html=True)
         
         # إحصائيات الأحداث
-        if 'Event' in df_filtered.columns:
-            st.subheader("📋 توزيع الأحداث")
-            event_stats = df_filtered['Event'].value_counts().reset_index()
-            event_stats.columns = ['الحدث', 'التكرار']
+        if stats['event_stats'] is not None:
+            st.subheader("📋 توزيع الأحداث (تقديري)" if stats['approximate'] else "📋 توزيع الأحداث")
+            event_stats = stats['event_stats']
             
             # عرض جدول التكرارات
             st.dataframe(
@@ -613,311 +2737,44 @@ with tab2:
             if len(event_stats) > 0:
                 top_5_events = event_stats.head(5)
                 for idx, row in top_5_events.iterrows():
-                    percentage = (row['التكرار'] / len(df_filtered)) * 100 if len(df_filtered) > 0 else 0
+                    percentage = (row['التكرار'] / stats['total']) * 100 if stats['total'] > 0 else 0
                     st.markdown(f"""
                     <div class="metric-card">
-                        <strong>{row['الحدث']}</strong>: {row['التكرار']} مرة 
+                        <strong>{row['الحدث']}</strong>: {approx_prefix}{row['التكرار']:,} مرة 
                         ({percentage:.1f}% من إجمالي الأحداث)
                     </div>
                     """, unsafe_allow_html=True)
         
         # البحث في التفاصيل
         if 'Details' in df_filtered.columns:
-            st.subheader("🔍 البحث في التفاصيل")
-            search_term = st.text_input("ابحث في التفاصيل:")
-            
-            if search_term:
-                try:
-                    search_results = df_filtered[df_filtered['Details'].str.contains(search_term, case=False, na=False)]
-                    st.write(f"نتائج البحث ({len(search_results)} سجل):")
-                    st.dataframe(search_results.head(20), use_container_width=True)
-                except:
-                    st.warning("⚠️ تعذر البحث في التفاصيل")
+            render_details_search(df_filtered, filtered_key)
 
-with tab3:
+elif section == "⏱ حساب التوقف":
     st.header("⏱ حساب إجمالي مدة التوقف")
     
     if 'Event' not in df.columns:
         st.warning("⚠️ البيانات لا تحتوي على عمود 'Event' لحساب التوقف.")
-        st.stop()
-    
-    # قسمين: لحساب توقف حدث واحد و لمجموعة أحداث
-    downtime_tab1, downtime_tab2 = st.tabs(["📊 توقف حدث واحد", "📈 توقف مجموعة أحداث"])
-    
-    with downtime_tab1:
-        st.markdown("### حساب مدة التوقف لحدث معين")
-        
-        # اختيار الحدث
-        all_events = sorted(df['Event'].dropna().unique().tolist())
-        
-        if not all_events:
-            st.warning("⚠️ لا توجد أحداث في البيانات.")
-            st.stop()
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            selected_event = st.selectbox(
-                "اختر حدث التوقف:",
-                options=all_events,
-                key="single_event_select"
-            )
-        
-        with col2:
-            # البحث عن حدث مرجعي مناسب
-            ref_options = all_events
-            ref_index = 0
-            if 'Automatic mode' in all_events:
-                ref_index = all_events.index('Automatic mode')
-            elif 'Manual mode' in all_events:
-                ref_index = all_events.index('Manual mode')
-            
-            reference_event = st.selectbox(
-                "اختر حدث التشغيل (المرجع):",
-                options=all_events,
-                index=ref_index,
-                key="single_ref_select"
-            )
-        
-        # زر الحساب
-        if st.button("🧮 حساب مدة التوقف", type="primary", key="calculate_single"):
-            with st.spinner("جاري حساب مدة التوقف..."):
-                total_minutes, event_count, periods = calculate_downtime(df, selected_event, reference_event)
-                
-                if event_count > 0:
-                    if periods:
-                        # عرض النتائج
-                        st.markdown(f"""
-                        <div class="highlight-box">
-                            <h2>📊 نتائج حساب التوقف</h2>
-                            <h3>إجمالي مدة التوقف: <span style="color: #FFD700">{total_minutes:.2f} دقيقة</span></h3>
-                            <p>عدد مرات التوقف: {event_count} مرة</p>
-                            <p>متوسط مدة التوقف: {total_minutes/event_count:.2f} دقيقة</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # تحويل المدة إلى ساعات وأيام
-                        hours = total_minutes / 60
-                        days = hours / 24
-                        
-                        # عرض بتنسيق جميل
-                        col_a, col_b, col_c = st.columns(3)
-                        
-                        with col_a:
-                            st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
-                            st.markdown(f"**إجمالي الدقائق**")
-                            st.markdown(f"# {total_minutes:.2f}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        with col_b:
-                            st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
-                            st.markdown(f"**إجمالي الساعات**")
-                            st.markdown(f"# {hours:.2f}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        with col_c:
-                            st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
-                            st.markdown(f"**إجمالي الأيام**")
-                            st.markdown(f"# {days:.2f}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        
-                        # عرض تفاصيل فترات التوقف
-                        st.subheader("📋 تفاصيل فترات التوقف")
-                        
-                        if periods:
-                            periods_df = pd.DataFrame(periods)
-                            st.dataframe(
-                                periods_df,
-                                use_container_width=True,
-                                column_config={
-                                    "بداية التوقف": st.column_config.DatetimeColumn("بداية التوقف"),
-                                    "نهاية التوقف": st.column_config.DatetimeColumn("نهاية التوقف"),
-                                    "المدة (دقائق)": st.column_config.NumberColumn("المدة (دقائق)", format="%.2f"),
-                                    "الحدث": st.column_config.TextColumn("الحدث"),
-                                    "التفاصيل": st.column_config.TextColumn("التفاصيل", width="large")
-                                }
-                            )
-                            
-                            # ملخص فترات التوقف
-                            st.subheader("📊 ملخص فترات التوقف")
-                            
-                            min_duration = periods_df['المدة (دقائق)'].min()
-                            max_duration = periods_df['المدة (دقائق)'].max()
-                            avg_duration = periods_df['المدة (دقائق)'].mean()
-                            
-                            col_d, col_e, col_f = st.columns(3)
-                            
-                            with col_d:
-                                st.metric("أقل مدة توقف", f"{min_duration:.2f} دقيقة")
-                            
-                            with col_e:
-                                st.metric("أكثر مدة توقف", f"{max_duration:.2f} دقيقة")
-                            
-                            with col_f:
-                                st.metric("المتوسط", f"{avg_duration:.2f} دقيقة")
-                    else:
-                        st.warning(f"⚠️ تم العثور على {event_count} حدث من نوع '{selected_event}' ولكن لا يمكن حساب مدة التوقف بسبب عدم وجود أحداث مرجعية بعدها.")
-                else:
-                    st.error(f"❌ لم يتم العثور على أي حدث من نوع '{selected_event}' في البيانات.")
-    
-    with downtime_tab2:
-        st.markdown("### حساب مدة التوقف لمجموعة أحداث")
-        
-        # اختيار مجموعة الأحداث
-        all_events = sorted(df['Event'].dropna().unique().tolist())
-        
-        col1, col2 = st.columns([3, 1])
-        
-        with col1:
-            selected_events = st.multiselect(
-                "اختر مجموعة أحداث التوقف:",
-                options=all_events,
-                default=all_events[:2] if len(all_events) >= 2 else all_events,
-                key="group_events_select"
-            )
+    else:
+        # قسمين: لحساب توقف حدث واحد و لمجموعة أحداث
+        downtime_tab1, downtime_tab2 = st.tabs(["📊 توقف حدث واحد", "📈 توقف مجموعة أحداث"])
         
-        with col2:
-            # البحث عن حدث مرجعي مناسب
-            ref_options = all_events
-            ref_index = 0
-            if 'Automatic mode' in all_events:
-                ref_index = all_events.index('Automatic mode')
-            elif 'Manual mode' in all_events:
-                ref_index = all_events.index('Manual mode')
-            
-            reference_event = st.selectbox(
-                "اختر حدث التشغيل (المرجع):",
-                options=all_events,
-                index=ref_index,
-                key="group_ref_select"
-            )
+        with downtime_tab1:
+            render_single_downtime(df, events_key, work_calendar)
         
-        # زر الحساب للمجموعة
-        if st.button("🧮 حساب مدة توقف المجموعة", type="primary", key="calculate_group"):
-            with st.spinner("جاري حساب مدة توقف المجموعة..."):
-                if selected_events:
-                    total_minutes, event_count, periods = calculate_group_downtime(df, selected_events, reference_event)
-                    
-                    if event_count > 0:
-                        if periods:
-                            # عرض النتائج
-                            events_str = ", ".join(selected_events)
-                            st.markdown(f"""
-                            <div class="highlight-box">
-                                <h2>📊 نتائج حساب توقف المجموعة</h2>
-                                <h3>إجمالي مدة التوقف: <span style="color: #FFD700">{total_minutes:.2f} دقيقة</span></h3>
-                                <p>عدد مرات التوقف: {event_count} مرة</p>
-                                <p>متوسط مدة التوقف: {total_minutes/event_count:.2f} دقيقة</p>
-                                <p>الأحداث المختارة: {events_str}</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-                            
-                            # تحويل المدة إلى ساعات وأيام
-                            hours = total_minutes / 60
-                            days = hours / 24
-                            
-                            # عرض بتنسيق جميل
-                            col_a, col_b, col_c = st.columns(3)
-                            
-                            with col_a:
-                                st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
-                                st.markdown(f"**إجمالي الدقائق**")
-                                st.markdown(f"# {total_minutes:.2f}")
-                                st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            with col_b:
-                                st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
-                                st.markdown(f"**إجمالي الساعات**")
-                                st.markdown(f"# {hours:.2f}")
-                                st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            with col_c:
-                                st.markdown('<div class="downtime-card">', unsafe_allow_html=True)
-                                st.markdown(f"**إجمالي الأيام**")
-                                st.markdown(f"# {days:.2f}")
-                                st.markdown('</div>', unsafe_allow_html=True)
-                            
-                            # عرض تفاصيل فترات التوقف
-                            st.subheader("📋 تفاصيل فترات التوقف")
-                            
-                            if periods:
-                                periods_df = pd.DataFrame(periods)
-                                st.dataframe(
-                                    periods_df,
-                                    use_container_width=True,
-                                    column_config={
-                                        "بداية التوقف": st.column_config.DatetimeColumn("بداية التوقف"),
-                                        "نهاية التوقف": st.column_config.DatetimeColumn("نهاية التوقف"),
-                                        "المدة (دقائق)": st.column_config.NumberColumn("المدة (دقائق)", format="%.2f"),
-                                        "الحدث": st.column_config.TextColumn("الحدث"),
-                                        "التفاصيل": st.column_config.TextColumn("التفاصيل", width="large")
-                                    }
-                                )
-                        else:
-                            st.warning(f"⚠️ تم العثور على {event_count} حدث من المجموعة المختارة ولكن لا يمكن حساب مدة التوقف بسبب عدم وجود أحداث مرجعية بعدها.")
-                    else:
-                        st.error(f"❌ لم يتم العثور على أي حدث من المجموعة المختارة في البيانات.")
-                else:
-                    st.warning("⚠️ يرجى اختيار حدث واحد على الأقل من القائمة.")
+        with downtime_tab2:
+            render_group_downtime(df, data_key, work_calendar)
 
-with tab4:
-    st.header("📥 خيارات التصدير")
-    
-    st.info("""
-    يمكنك تصدير البيانات المصفاة إلى عدة صيغ مختلفة.
-    اختر الصيغة المناسبة واحفظ البيانات على جهازك.
-    """)
-    
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.markdown("### 📄 Excel")
-        st.markdown("صيغة جدول بيانات متقدمة")
-        
-        # زر التصدير إلى Excel
-        if st.button("💾 تصدير إلى Excel", use_container_width=True, key="export_excel_main"):
-            try:
-                download_link = convert_to_excel_download(df_filtered, "data_export.xlsx")
-                if download_link:
-                    st.markdown(download_link, unsafe_allow_html=True)
-                    st.success("✅ تم تجهيز ملف Excel للتحميل")
-            except Exception as e:
-                st.error(f"❌ خطأ في تصدير Excel: {e}")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.markdown("### 📊 CSV")
-        st.markdown("صيغة نصية بسيطة")
-        
-        # زر التصدير إلى CSV
-        if st.button("📊 تصدير إلى CSV", use_container_width=True, key="export_csv_main"):
-            try:
-                csv_data = df_filtered.to_csv(index=False, encoding='utf-8-sig')
-                b64 = base64.b64encode(csv_data.encode('utf-8-sig')).decode()
-                href = f'<a href="data:text/csv;charset=utf-8-sig;base64,{b64}" download="data_export.csv">📥 انقر للتحميل</a>'
-                st.markdown(href, unsafe_allow_html=True)
-                st.success("✅ تم تجهيز ملف CSV للتحميل")
-            except Exception as e:
-                st.error(f"❌ خطأ في تصدير CSV: {e}")
-        st.markdown('</div>', unsafe_allow_html=True)
-    
-    # إحصائيات التصدير
-    st.markdown("### 📈 ملخص البيانات المصدَّرة")
-    st.write(f"**عدد السجلات:** {len(df_filtered):,}")
-    st.write(f"**عدد الأعمدة:** {len(df_filtered.columns)}")
-    
-    # عرض أسماء الأعمدة
-    if len(df_filtered.columns) > 0:
-        st.write(f"**الأعمدة:** {', '.join(df_filtered.columns.tolist())}")
-    
-    # معاينة البيانات قبل التصدير
-    with st.expander("👁️ معاينة البيانات قبل التصدير"):
-        if len(df_filtered) > 0:
-            st.dataframe(df_filtered.head(10), use_container_width=True)
-        else:
-            st.info("لا توجد بيانات للمعاينة")
+elif section == "📥 التصدير":
+    render_export(df_filtered)
+
+elif section == "🕒 الخط الزمني":
+    render_timeline(df, data_key, machine_col)
+
+elif section == "🚨 رصد الموجات":
+    render_bursts(df, data_key, events_key, machine_col)
+
+elif section == "🔗 تسلسل الأحداث":
+    render_sequences(df, events_key, machine_col)
 
 # تذييل الصفحة
 st.markdown("---")
@@ -0,0 +1,212 @@
+"""
+واجهة استعلام JSON محلية: تحتفظ بمجموعات البيانات المحضرة في الذاكرة وتجيب على
+دفعات من الاستعلامات عبر HTTP بدون إعادة تحميل أو تحليل الملفات
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+# أقصى عدد من الاستعلامات في الطلب الواحد
+MAX_BATCH_SIZE = 500
+
+# استعلامات تُرجع صفوفاً أو فترات بحجم غير محدود فلا تُحفظ نتائجها (الذاكرة المؤقتة محدودة بالعدد لا بالحجم)
+UNCACHED_QUERY_TYPES = ('rows',)
+
+
+class DatasetRegistry:
+    """
+    سجل مجموعات البيانات الجاهزة في الذاكرة مع ذاكرة مؤقتة لنتائج الاستعلامات
+    """
+
+    def __init__(self, max_datasets=4, max_cached_results=2048):
+        self._lock = threading.Lock()
+        self._datasets = OrderedDict()
+        self._results = OrderedDict()
+        self.max_datasets = max_datasets
+        self.max_cached_results = max_cached_results
+
+    def put(self, key, df, label=""):
+        """
+        إضافة مجموعة بيانات (أو تحديثها كأحدث مجموعة) مرتبة حسب الوقت مرة واحدة
+        """
+        with self._lock:
+            if key in self._datasets:
+                self._datasets.move_to_end(key)
+                return
+        if 'DateTime' in df.columns:
+            df = df.sort_values('DateTime', kind='stable').reset_index(drop=True)
+        with self._lock:
+            self._datasets[key] = {'df': df, 'label': label, 'loaded_at': datetime.now()}
+            while len(self._datasets) > self.max_datasets:
+                self._datasets.popitem(last=False)
+
+    def get(self, key=None):
+        """
+        إرجاع مجموعة بيانات بمفتاحها أو أحدث مجموعة إذا لم يُحدد المفتاح
+        """
+        with self._lock:
+            if not self._datasets:
+                raise KeyError("لا توجد بيانات محملة")
+            if key is None:
+                key = next(reversed(self._datasets))
+            if key not in self._datasets:
+                raise KeyError(f"مجموعة البيانات غير موجودة: {key}")
+            return key, self._datasets[key]['df']
+
+    def describe(self):
+        with self._lock:
+            items = list(self._datasets.items())
+        datasets = []
+        for key, item in items:
+            df = item['df']
+            info = {'key': key, 'label': item['label'], 'rows': len(df), 'columns': df.columns.tolist(), 'loaded_at': item['loaded_at']}
+            if 'DateTime' in df.columns and len(df) > 0:
+                info['start'] = df['DateTime'].iloc[0]
+                info['end'] = df['DateTime'].iloc[-1]
+            datasets.append(info)
+        return datasets
+
+    def cached_result(self, cache_key, compute):
+        """
+        إرجاع نتيجة استعلام محفوظة أو حسابها وحفظها (الأقدم استخداماً يُحذف أولاً)
+        """
+        with self._lock:
+            if cache_key in self._results:
+                self._results.move_to_end(cache_key)
+                return self._results[cache_key]
+        result = compute()
+        with self._lock:
+            self._results[cache_key] = result
+            while len(self._results) > self.max_cached_results:
+                self._results.popitem(last=False)
+        return result
+
+
+def _json_default(value):
+    """
+    تحويل أنواع pandas و numpy والتواريخ إلى قيم JSON (القيم الناقصة تصبح null)
+    """
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (pd.Timedelta, timedelta)):
+        return value.total_seconds()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value) if np.isfinite(value) else None
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, np.ndarray):
+        return _without_nan(value.tolist())
+    if isinstance(value, pd.DataFrame):
+        return _without_nan(value.astype(object).where(value.notna(), None).to_dict(orient='records'))
+    return str(value)
+
+
+def _without_nan(value):
+    """
+    استبدال NaN و Infinity (غير صالحة في JSON) بالقيمة null داخل القواميس والقوائم
+    """
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: _without_nan(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_without_nan(v) for v in value]
+    return value
+
+
+def run_queries(registry, queries, handlers, dataset_key=None):
+    """
+    تنفيذ دفعة من الاستعلامات على مجموعة بيانات واحدة؛ خطأ أي استعلام لا يوقف الباقي
+    """
+    key, df = registry.get(dataset_key)
+    results = []
+    for query in queries:
+        query_type = query.get('type') if isinstance(query, dict) else None
+        handler = handlers.get(query_type)
+        if handler is None:
+            results.append({'type': query_type, 'error': f"نوع استعلام غير معروف: {query_type}"})
+            continue
+        params = {k: v for k, v in query.items() if k != 'type'}
+        try:
+            if query_type in UNCACHED_QUERY_TYPES or params.get('include_periods'):
+                result = handler(df, params)
+            else:
+                cache_key = (key, json.dumps(query, sort_keys=True, default=str))
+                result = registry.cached_result(cache_key, lambda: handler(df, params))
+            results.append({'type': query_type, 'result': result})
+        except Exception as e:
+            results.append({'type': query_type, 'error': str(e)})
+    return key, results
+
+
+def make_handler(registry, handlers):
+    """
+    إنشاء معالج طلبات HTTP مرتبط بسجل البيانات ودوال الاستعلام
+    """
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            # Python يكتب NaN كما هي (JSON غير صالح) ولا يمررها إلى default، لذلك تُستبدل أولاً
+            body = json.dumps(_without_nan(payload), ensure_ascii=False, allow_nan=False, default=_json_default).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip('/')
+            if path in ('', '/health'):
+                self._send_json(200, {'status': 'ok', 'queries': sorted(handlers)})
+            elif path == '/datasets':
+                self._send_json(200, {'datasets': registry.describe()})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip('/') != '/query':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                # يقبل استعلاماً واحداً أو دفعة {"queries": [...]}
+                queries = payload.get('queries', [payload]) if isinstance(payload, dict) else payload
+                if len(queries) > MAX_BATCH_SIZE:
+                    raise ValueError(f"الحد الأقصى {MAX_BATCH_SIZE} استعلام في الطلب")
+                dataset_key = payload.get('dataset') if isinstance(payload, dict) else None
+                key, results = run_queries(registry, queries, handlers, dataset_key)
+            except KeyError as e:
+                self._send_json(404, {'error': str(e.args[0]) if e.args else str(e)})
+                return
+            except Exception as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            self._send_json(200, {'dataset': key, 'results': results})
+
+        def log_message(self, format, *args):
+            # عدم طباعة سطر لكل طلب عند الاستعلام بمعدل عالٍ
+            pass
+
+    return QueryHandler
+
+
+def start_query_server(registry, handlers, host="127.0.0.1", port=8600):
+    """
+    تشغيل خادم الاستعلام في خيط خلفي وإرجاع كائن الخادم
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(registry, handlers))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="query-api", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,234 @@
+"""
+مصدر بيانات بعيد: جلب ملفات السجلات من خادم ملفات HTTP أو مستودع GitHub
+مع نسخة محلية مُعنونة بالمحتوى، بحيث لا تُنزَّل إلا الملفات التي تغيرت
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse, unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+
+# امتدادات ملفات السجلات التي يمكن تحميلها في التطبيق
+LOG_EXTENSIONS = ('.txt', '.csv', '.csv.gz', '.xlsx', '.xls', '.parquet', '.arrow', '.feather')
+
+# المجلد الافتراضي للنسخة المحلية
+DEFAULT_MIRROR_DIR = os.path.join(os.path.expanduser("~"), ".cache", "log_mirror")
+
+# مضيفات GitHub التي يُرسل إليها رمز الوصول عند المزامنة من مستودع GitHub
+GITHUB_HOSTS = ("github.com", "api.github.com", "raw.githubusercontent.com")
+
+
+class HostTokenAuth(AuthBase):
+    """
+    إضافة رمز الوصول للطلبات الموجهة إلى المضيفات المسموح بها فقط، حتى لا يُرسل
+    الرمز إلى روابط خارجية في صفحة الفهرس
+    """
+
+    def __init__(self, token, hosts):
+        self.token = token
+        self.hosts = {host.lower() for host in hosts if host}
+
+    def __call__(self, request):
+        host = (urlparse(request.url).hostname or "").lower()
+        if host in self.hosts:
+            request.headers['Authorization'] = f"token {self.token}"
+        return request
+
+
+class LogMirror:
+    """
+    نسخة محلية من الملفات: المحتوى يُحفظ باسم بصمته (sha256)، وسجل لكل مفتاح ملف يحفظ
+    ETag و Last-Modified وإصدار المصدر وبصمة آخر نسخة لاستخدامها في الطلبات الشرطية
+
+    مفتاح الملف هو رابطه لخادم HTTP، أو المستودع والمسار لـ GitHub لأن روابط التنزيل
+    في المستودعات الخاصة تحمل رمزاً مؤقتاً يتغير في كل قائمة
+    """
+
+    def __init__(self, root=DEFAULT_MIRROR_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def get(self, key):
+        """
+        إرجاع سجل الملف إذا كانت نسخته موجودة محلياً
+        """
+        with self._lock:
+            entry = self.index.get(key)
+        if entry and os.path.exists(self.object_path(entry['sha256'])):
+            return entry
+        return None
+
+    def store(self, key, name, content, etag=None, last_modified=None, version=None):
+        """
+        حفظ المحتوى باسم بصمته (مرة واحدة لكل محتوى) وتحديث سجل الملف
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # الكتابة في ملف مؤقت ثم النقل حتى لا تبقى نسخة ناقصة عند الانقطاع
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        entry = {
+            'name': name,
+            'sha256': digest,
+            'size': len(content),
+            'etag': etag,
+            'last_modified': last_modified,
+            'version': version
+        }
+        with self._lock:
+            self.index[key] = entry
+        return entry
+
+    def save_index(self):
+        with self._lock:
+            data = json.dumps(self.index, ensure_ascii=False, indent=2)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+
+def create_session(pool_size=16, token=None, token_hosts=()):
+    """
+    إنشاء جلسة HTTP بمجموعة اتصالات قابلة لإعادة الاستخدام
+
+    رمز الوصول يُرسل فقط إلى المضيفات في token_hosts (مضيف الفهرس أو مضيفات GitHub)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if token:
+        session.auth = HostTokenAuth(token, token_hosts)
+    return session
+
+
+def list_http_files(session, index_url, extensions=LOG_EXTENSIONS, timeout=30):
+    """
+    قائمة ملفات السجلات من صفحة فهرس HTTP (روابط href) أو من ملف JSON يحتوي على أسماء أو روابط
+
+    كل عنصر (الاسم، الرابط، مفتاح النسخة المحلية، الإصدار)؛ المفتاح هو الرابط ولا يوجد إصدار
+    """
+    response = session.get(index_url, timeout=timeout)
+    response.raise_for_status()
+
+    if 'json' in response.headers.get('Content-Type', ''):
+        links = [item if isinstance(item, str) else item.get('url') or item.get('name') for item in response.json()]
+    else:
+        links = re.findall(r'href=["\']([^"\']+)["\']', response.text, flags=re.IGNORECASE)
+
+    files = {}
+    for link in links:
+        if not link:
+            continue
+        url = urljoin(index_url, link)
+        name = unquote(os.path.basename(urlparse(url).path))
+        if name.lower().endswith(extensions):
+            files.setdefault(url, name)
+
+    return [(name, url, url, None) for url, name in files.items()]
+
+
+def list_github_files(repo_name, path="", ref=None, token=None, extensions=LOG_EXTENSIONS):
+    """
+    قائمة ملفات السجلات في مجلد داخل مستودع GitHub مع روابط التنزيل المباشر
+
+    المفتاح مبني على المستودع والفرع والمسار، والإصدار هو sha الملف في المستودع
+    فلا يُعاد تنزيل ملف لم يتغير
+    """
+    from github import Github
+
+    github = Github(token) if token else Github()
+    repo = github.get_repo(repo_name)
+    contents = repo.get_contents(path, ref=ref) if ref else repo.get_contents(path)
+    if not isinstance(contents, list):
+        contents = [contents]
+
+    return [
+        (item.name, item.download_url, f"github:{repo_name}@{ref or ''}:{item.path}", item.sha)
+        for item in contents
+        if item.type == "file" and item.download_url and item.name.lower().endswith(extensions)
+    ]
+
+
+def fetch_file(session, mirror, name, url, key=None, version=None, timeout=60):
+    """
+    تنزيل ملف بطلب شرطي (If-None-Match / If-Modified-Since) وحفظه في النسخة المحلية
+
+    إذا كان إصدار المصدر معروفاً ومطابقاً للنسخة المحلية لا يُرسل أي طلب
+    """
+    key = key or url
+    entry = mirror.get(key)
+    if entry and version and entry.get('version') == version:
+        return dict(entry, url=url, path=mirror.object_path(entry['sha256']), status='unchanged')
+
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and entry:
+        return dict(entry, url=url, path=mirror.object_path(entry['sha256']), status='unchanged')
+    response.raise_for_status()
+
+    new_entry = mirror.store(
+        key,
+        name,
+        response.content,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        version=version
+    )
+    if entry is None:
+        status = 'new'
+    elif entry['sha256'] == new_entry['sha256']:
+        status = 'unchanged'
+    else:
+        status = 'updated'
+
+    return dict(new_entry, url=url, path=mirror.object_path(new_entry['sha256']), status=status)
+
+
+def sync_files(files, mirror, session, max_workers=8, timeout=60):
+    """
+    مزامنة قائمة ملفات (الاسم، الرابط، المفتاح، الإصدار) بالتوازي وإرجاع حالة كل ملف
+    """
+    def fetch(item):
+        name, url, key, version = item
+        try:
+            return fetch_file(session, mirror, name, url, key, version, timeout=timeout)
+        except Exception as e:
+            return {'name': name, 'url': url, 'status': 'error', 'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(fetch, files))
+
+    mirror.save_index()
+    return results